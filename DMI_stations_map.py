@@ -2,13 +2,13 @@
 ## Author: Bianca E. Sandvik (April 2023)
 
 ## This script plots all DMI stations listed onto a map with their station ID. 
-## Locations are extracted from each stations individual parquet-file.
+## Locations are read for all stations at once from the DMI/ERA5 dataset (see "dmi_dataset.py").
 
 
 # Import packages:
 import pandas as pd
 import numpy as np
-import glob       
+from dmi_dataset import read_dataset     #Station and year partitioned parquet datasets
 import pandas as pd
 import matplotlib.pyplot as plt
 from mpl_toolkits.basemap import Basemap
@@ -28,18 +28,12 @@ st_ID = list(DMIstations['Station_ID'])                                 #create
 
 
 ## Insert the last longitude and latitude position for each station into dataframe:
-lon_list = []                                                           #create empty list to hold location variables
-lat_list = []
+location_df = read_dataset('DMI_ERA5_monthly', st_ID, columns=['DMI_Lon', 'DMI_Lat'])      #read only the locations of all stations at once
+last_location = location_df.groupby('Station_ID').tail(1).set_index('Station_ID')     #final position of each station
+stored_st = [station for station in st_ID if station in last_location.index]         #stations in the dataset
 
-for station in st_ID:
-    glob_string = 'DMI_ERA5_' + station + '_monthly.parq.gzip'          #Create a dynamic string for input to search for station specific parquet-files
-    dmi_ERA5_zip = glob.glob(glob_string)                               #Find station specific parquet-files in current directory
-    for i in dmi_ERA5_zip:
-        df = pd.read_parquet(i)                                         #Read and print parquet-file
-        #print(df)
-
-        lon_list.append(df.DMI_Lon[-1])                                 #insert final longitude position into list
-        lat_list.append(df.DMI_Lat[-1])                                 #insert final longitude position into list
+lon_list = list(last_location.loc[stored_st, 'DMI_Lon'])                #list of final longitude positions
+lat_list = list(last_location.loc[stored_st, 'DMI_Lat'])                #list of final latitude positions
 
 DMIstations.insert(2,'Longitude', lon_list)                             #insert lonitude location into dataframe as new column
 DMIstations.insert(3,'Latitude', lat_list)                              #insert latitude location into dataframe as new column
@@ -81,22 +75,12 @@ plt.close(None)
 
 from matplotlib.lines import Line2D
 
-lon_list_start = []                                                     #create empty list to hold location variables
-lat_list_start = []
-lon_list_end = []                                              
-lat_list_end = []
-
-for station in st_ID:
-    glob_string = 'DMI_ERA5_' + station + '_monthly.parq.gzip'          #Create a dynamic string for input to search for station specific parquet-files
-    dmi_ERA5_zip = glob.glob(glob_string)                               #Find station specific parquet-files in current directory
-    for i in dmi_ERA5_zip:
-        df = pd.read_parquet(i)                                         #Read and print parquet-file
-        #print(df)
-
-        lon_list_start.append(df.DMI_Lon[0])                            #insert start longitude position into list
-        lat_list_start.append(df.DMI_Lat[0])                            #insert start latitude position into list
-        lon_list_end.append(df.DMI_Lon[-1])                             #insert final longitude position into list
-        lat_list_end.append(df.DMI_Lat[-1])                             #insert final latitude position into list
+first_location = location_df.groupby('Station_ID').head(1).set_index('Station_ID')   #start position of each station
+
+lon_list_start = list(first_location.loc[stored_st, 'DMI_Lon'])         #list of start longitude positions
+lat_list_start = list(first_location.loc[stored_st, 'DMI_Lat'])         #list of start latitude positions
+lon_list_end = list(last_location.loc[stored_st, 'DMI_Lon'])            #list of final longitude positions
+lat_list_end = list(last_location.loc[stored_st, 'DMI_Lat'])            #list of final latitude positions
 
 DMIstations.insert(2,'Lon_start', lon_list_start)                       #insert location into dataframe as new column
 DMIstations.insert(3,'Lat_start', lat_list_start)     
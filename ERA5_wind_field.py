@@ -12,10 +12,18 @@ import cartopy.io.img_tiles as cimgt
 from wrf import to_np                                                       #covert variables to numpy
 import colormaps as cmaps                                                   #for defining colormaps
 from matplotlib.lines import Line2D
+from era5_tools import open_xr_subset, read_subset                          #read only a region and period of ERA5-files
+
+
+## Set adjustables:
+extent = (6.9, 15.4, 54, 58)                                                #region of the maps (lon_min, lon_max, lat_min, lat_max)
+time_range = None                                                           #period of the means (start, end), e.g. ('1990-01-01', '2022-12-31'), None: all
+level = 1000                                                                #pressure level of the geostrophic wind (hPa), used if the file has several levels
+    #Only the gridpoints inside the map region and the timesteps inside the period are read from the ERA5-files.
 
 
 ## Import dataset:
-ds = xr.open_dataset("ERA5_ug_vg_wind_speed_wind_dir.nc")                   #import geostrophic dataset
+ds = open_xr_subset("ERA5_ug_vg_wind_speed_wind_dir.nc", extent, time_range, level)   #import geostrophic dataset
 ds_1D = ds.mean(dim='time')                                                 #create a 1D dataframe with means
 
 # Define variables:
@@ -30,8 +38,8 @@ ug_full = ds.variables['ug']
 vg_full = ds.variables['vg']
 
 # Compare calculation to ERA5:
-de = xr.open_dataset("ERA5_10m_u-comp.wind_1990-2022.nc")                   #import datasets
-dv = xr.open_dataset("ERA5_10m_v-comp.wind_1990-2022.nc")                   
+de = open_xr_subset("ERA5_10m_u-comp.wind_1990-2022.nc", extent, time_range)   #import datasets
+dv = open_xr_subset("ERA5_10m_v-comp.wind_1990-2022.nc", extent, time_range)
 de_1D = de.mean(dim='time')                                                 #create a 1D dataframes with means
 dv_1D = dv.mean(dim='time')  
 v10 = dv_1D.variables['v10']                                                #define variables
@@ -45,47 +53,22 @@ u10 = de_1D.variables['u10']
 import pandas as pd
 import netCDF4 as nc
 
-ds_pd = nc.Dataset('ERA5_ug_vg_wind_speed_wind_dir.nc', 'r')            #Import datasets
-du_pd = nc.Dataset('ERA5_10m_u-comp.wind_1990-2022.nc', 'r')
-dv_pd = nc.Dataset('ERA5_10m_v-comp.wind_1990-2022.nc', 'r')
-
-# define numbers of lon, lat and time
-nlat = len(du_pd.variables['latitude'])
-nlon = len(du_pd.variables['longitude'])
-ntime = len(du_pd.variables['time'])
-    #du_pd, dv_pd and ds_pd have the same dimensions
+# Read the region and period of the geostrophic wind speed, u10 and v10 into arrays (time, lat, lon):
+    #the three files have the same grid, so the same region gives the same gridpoints
+ws_array = read_subset('ERA5_ug_vg_wind_speed_wind_dir.nc', 'wind_speed', extent, time_range, level)    #geostrophic wind speed
+u10_ar = read_subset('ERA5_10m_u-comp.wind_1990-2022.nc', 'u10', extent, time_range)             #u10
+v10_ar = read_subset('ERA5_10m_v-comp.wind_1990-2022.nc', 'v10', extent, time_range)             #v10
+ntime, nlat, nlon = ws_array.shape                                          #numbers of time, lat and lon
 
 #Define variables:
 ws_full = ds.variables['wind_speed']                                    #geostrophic wind speed
 ug_full = ds.variables['ug']                                            #geostrophic ug          
 vg_full = ds.variables['vg']                                            #geostrophic vg
 
-u10_full = du_pd.variables['u10']                                            #u10
-v10_full = dv_pd.variables['v10']                                            #v10
-
-ws10 = np.zeros( (ntime,nlat,nlon) )                                    #calculate wind speed from u10 and v10
-for ilat in range(nlat):
-    ws10[:,:,:] = np.sqrt(u10_full[:,:,:]**2 + v10_full[:,:,:]**2)
-
-ws_array = np.zeros( (ntime,nlat,nlon) )                                #convert netCDF geostrophic wind speed to array
-for ilat in range(nlat):
-    ws_array[:,:,:] = ws_full[:,:,:]
-
-
-u10_ar = np.zeros( (ntime,nlat,nlon) )                                #convert netCDF u10 to array                  
-for ilat in range(nlat):
-    u10_ar[:,:,:] = u10_full[:,:,:]
-
-v10_ar = np.zeros( (ntime,nlat,nlon) )                                #convert netCDF v10 to array
-for ilat in range(nlat):
-    v10_ar[:,:,:] = v10_full[:,:,:]
-
-
+ws10 = np.sqrt(u10_ar**2 + v10_ar**2)                                   #calculate wind speed from u10 and v10
 
 #calculate difference between geostrophic wind speed and 10m wind speed
-diff = np.zeros( (ntime,nlat,nlon) )                                        
-for ilat in range(nlat):
-    diff = ws_array[:,:,:] - ws10[:,:,:]
+diff = ws_array - ws10
 
 diff_1D = diff.mean(0)                                                      #calculate means of difference over the time axis
 
@@ -94,11 +77,11 @@ proj = ccrs.epsg(3857)                                                      #def
 cmap = 'Greens'                                                               #define colourscheme for wind speed
 
 fig = plt.figure(figsize=(10, 8))                                           #define subplot 
-ax = plt.axes(projection=proj, extent=(6.9, 15.4, 54, 58))
+ax = plt.axes(projection=proj, extent=extent)
 plt.contourf(lons, lats, diff_1D, 70, cmap=cmap, transform=ccrs.PlateCarree())   #create wind speed contour
 ax.coastlines()                                                             #set coastlines
 
-ax.set_extent(extents=(6.9, 15.4, 54, 58))                                  #define plot extent
+ax.set_extent(extents=extent)                                  #define plot extent
 
 plt.colorbar(ax=ax, pad=0.05, shrink=0.85, label='Wind speed difference [m/s]')        #set colorbar
 plt.title('Difference in mean wind speed 1990-2022 (' + r'$V_g - V_{10}$' + ')')
@@ -115,13 +98,13 @@ plt.close()
 terrain = cimgt.GoogleTiles(style='satellite')                              #import satellite image
 
 fig = plt.figure(figsize=(10, 8))                                           #define subplot 
-ax = fig.add_subplot(projection=terrain.crs, extent=(6.9, 15.4, 54, 58))        
+ax = fig.add_subplot(projection=terrain.crs, extent=extent)        
 ax.add_image(terrain, 8)                                                    #add satelite image
 
 q_era5 = ax.quiver(to_np(lons), to_np(lats), to_np(u10), to_np(v10), scale=20, scale_units='inches', color='gold', transform=ccrs.PlateCarree())    #add wind quivers from ERA5
 q = ax.quiver(to_np(lons), to_np(lats), to_np(ug), to_np(vg), scale=20, scale_units='inches', color='lightcoral', transform=ccrs.PlateCarree())    #add wind quivers
 
-ax.set_extent(extents=(6.9, 15.4, 54, 58))                                  #define plot extent
+ax.set_extent(extents=extent)                                  #define plot extent
 
 legend_elements = [Line2D([0], [0], marker='^', color='none', label='Geostrophic wind', markerfacecolor='lightcoral', markeredgecolor='none', markersize=9),
                    Line2D([0], [0], marker='^', color='none', label='10 m wind', markerfacecolor='gold', markeredgecolor='none', markersize=9)]
@@ -140,12 +123,12 @@ proj = ccrs.epsg(3857)                                                      #def
 cmap = 'YlOrBr'                                                             #define colourscheme for wind speed
 
 fig = plt.figure(figsize=(10, 8))                                           #define subplot 
-ax = plt.axes(projection=proj, extent=(6.9, 15.4, 54, 58))
+ax = plt.axes(projection=proj, extent=extent)
 plt.contourf(lons, lats, ws, 70, cmap=cmap, transform=ccrs.PlateCarree())   #create wind speed contour
 ax.coastlines()                                                             #set coastlines
 
 ax.quiver(to_np(lons), to_np(lats), to_np(ug), to_np(vg), color='darkgrey', transform=ccrs.PlateCarree())    #add wind quivers
-ax.set_extent(extents=(6.9, 15.4, 54, 58))                                  #define plot extent
+ax.set_extent(extents=extent)                                  #define plot extent
 
 plt.colorbar(ax=ax, pad=0.05, shrink=0.85, label='Wind speed [m/s]')        #set colorbar
 plt.title('Geostrophic mean wind field 1990-2022')
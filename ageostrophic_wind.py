@@ -5,16 +5,25 @@
 ## and calculates the ageostrophic wind for each station based on data from DMI station observations and corresponding ERA5-data coupled 
 ## in the script "merge_dmi_data_ERA5.py".
 ## For each stations alpha it then creates time series plots and conduct a regression and autocorrelation analysis. 
+## In hourly mode alpha is also calculated from the instantaneous hourly DMI and ERA5 winds ("DMI_ERA5_hourly"), one station-year at a 
+## time, and stored in "ageo_hourly" with its monthly and yearly means in "ageo_hourly_monthly" and "ageo_hourly_yearly".
 
 # Import packages:
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates                       #for creating trendlines
-import glob                                             #For searching files in current directory
+from dmi_dataset import station_frames, write_station   #Station and year partitioned parquet datasets
+from geostrophic_kernel import signed_angle, wind_components     #Angle between geostrophic and 10m wind
+from dmi_dataset import station_years                   #Years stored for a station
+from dmi_timeseries import rollups                      #Monthly and yearly means with coverage
 import statsmodels.api as sm                                #For statistical analysis
 from statsmodels.graphics import tsaplots
 
+## Set adjustables:
+hourly_alpha = True                                     #True: also calculate alpha from the hourly data
+min_coverage = 0.8                                      #smallest fraction of valid hours for a monthly/yearly mean of hourly alpha
+
 # Define list of DMI stations:
 stationlist = [('06041', 'Skagen Fyr'),('06052' ,"Thyborøn"), ('06058', "Hvide Sande"), ('06079', "Anholt Havn"), 
     ('06080', "Esbjerg Lufthavn"), ('06081', "Blåvandshuk Fyr"), ('06096', "Rømø/Juvre"), ('06104', "Billund Lufthavn"),
@@ -31,72 +40,32 @@ st_name = list(DMIstations['Station_name'])                             #create
 
 st_name_nr = 0                                                          #create initial counter for station name
 for station in st_ID:
-    glob_string = 'DMI_ERA5_' + station + '_monthly.parq.gzip'          #Create a dynamic string for input to search for station specific parquet-files
-    dmi_ERA5_zip = glob.glob(glob_string)                               #Find station specific parquet-files in current directory
+    dmi_ERA5_zip = station_frames('DMI_ERA5_monthly', station)         #Read station specific data from the dataset (empty if not stored)
     station_name = st_name[st_name_nr]                                  #Fetch station name
     st_name_nr = st_name_nr + 1                                         #Counter for station names
-    for i in dmi_ERA5_zip:
-        df = pd.read_parquet(i)                                         #Read and print parquet-file
+    for df in dmi_ERA5_zip:
         #print(df)
 
         # Calculate 10m wind components for the DMI station:
-        md = 270 - df['DMI_wind_dir']                                   #Convert meteorological direction to math direction
-
-        DMI_u10 = df['DMI_wind_speed']*np.cos(md)                       #Calculate u-component
-        DMI_v10 = df['DMI_wind_speed']*np.sin(md)                       #Calculate v-component
+        DMI_u10, DMI_v10 = wind_components(df['DMI_wind_speed'], df['DMI_wind_dir'])   #u- and v-component from speed and direction (degrees)
 
         # Insert components into dataframe: 
         df.insert(2, 'DMI_u10', DMI_u10)                                #Insert u-component as column nr. 3
         df.insert(3, 'DMI_v10', DMI_v10)                                #Insert v-component as column nr. 4
 
 
-        ## Calculate angle between Vg and V10: 
-        alpha_list = []                                                 #define empty list to contain angle
-        k = np.array([0,0,1])                                           #define the vertical unit vector
-        err = 0.0001                                                    #small positive number to avoid division by zero if no wind occurs
-
-        for i in range(len(df)):
-            V10 = np.array([df['DMI_u10'][i], df['DMI_v10'][i], 0])     #define the wind vector at 10m
-            Vg = np.array([df['ERA5_ug'][i], df['ERA5_vg'][i], 0])      #define the geostrophic wind vector
-            #V10 = np.array([1,0,0])
-            #Vg = np.array([0,1,0])
-            
-            V10_norm = np.sqrt(V10[0]**2 + V10[1]**2 + V10[2]**2)       #calculate the norm for V10
-            Vg_norm = np.sqrt(Vg[0]**2 + Vg[1]**2 + Vg[2]**2)           #calculate the norm for Vg
-
-            V_crossprod = np.cross(Vg,V10)                              #calclate the cross product of Vg and V10
-            V_cross = V_crossprod / (Vg_norm * V10_norm + err)
-            sinalpha = np.dot(k,V_cross)                                #calculate the dot product 
-            alpha = np.arcsin(sinalpha)
-            alpha_deg = alpha * (180/np.pi)                             #convert angle from radians to degrees
-            #Vcross_abs = np.abs(Vcross)                                #take the absolute value of the dot product
-
-            # Alt. using dot product:
-            #Gives right angle size, but not angle direction.
-            abdot = np.dot(Vg,V10)
-            arccos= abdot / (Vg_norm * V10_norm + err)
-            cos = np.arccos(arccos)
-            cos_deg = cos * (180/np.pi)
-
-            # Angle correction of original cross product formula using the result from the dot product if the angle > 90 degrees:
-            if cos_deg > 90 and alpha < 0:                          #if angle is larger than 90 deg and alpha is negative      
-                alpha_deg = (-1)*cos_deg                                #convert to correct angle size and direction change
-            elif cos_deg > 90 and alpha > 0:                        #if angle is larger than 90 deg and alpha is positive
-                alpha_deg = cos_deg                                     #correct angle size
-            else:                                                   #if angle smaller than 90 deg, keep original value
-                 pass
-
-            alpha_list.append(alpha_deg)                            #insert values into list 
-
-        df.insert(10,'alpha', alpha_list)                           #insert ageostrophic wind into dataframe as new column
+        ## Calculate angle between Vg and V10 for all rows at once: 
+            #atan2 of the cross and dot products gives both the size and the direction of the angle, also above 90 degrees.
+        alpha = signed_angle(df['ERA5_ug'], df['ERA5_vg'], df['DMI_u10'], df['DMI_v10'])
+
+        df.insert(10,'alpha', alpha)                                #insert ageostrophic wind into dataframe as new column
         #df                                                         #print dataframe  
 
 
-        # Store as parquet-file: 
-        namegenerator_parq = 'ageo_' + station + '_monthly.parq.gzip'       #Create dynamic naming based on station ID for parquet-file
-        df.to_parquet(namegenerator_parq, compression='gzip')               #Create station specific parquet-file
+        # Store in the dataset: 
+        write_station('ageo_monthly', station, df)                          #Station specific partitions in "dmi_dataset/ageo_monthly"
 
-        print_parquet_month = pd.read_parquet(namegenerator_parq)           #Print
+        print_parquet_month = station_frames('ageo_monthly', station)[0]    #Print
         print('Printing monthly means for station', station, ':')
         #print_parquet_month
 
@@ -148,5 +117,33 @@ for station in st_ID:
 
 
 
-
-
+### Hourly alpha:
+    #Alpha is calculated from the hourly DMI and ERA5 wind vectors one station-year at a time, so the memory use does not depend on
+    #the length of the period. The hourly alpha of each year is written directly, the monthly and yearly means (averaged as unit
+    #vectors, with the number of valid hours) are collected for the station and written at the end.
+if hourly_alpha:
+    for station in st_ID:
+        alpha_monthly, alpha_yearly = [], []
+        for year in station_years('DMI_ERA5_hourly', station):
+            start = pd.Timestamp(year=year, month=1, day=1, tz='UTC')
+            end = pd.Timestamp(year=year+1, month=1, day=1, tz='UTC') - pd.Timedelta(1, 'ns')
+            hourly = station_frames('DMI_ERA5_hourly', station, start, end,
+                                    columns=['DMI_wind_speed', 'DMI_wind_dir', 'ERA5_ug', 'ERA5_vg'])
+            if len(hourly) == 0:
+                continue
+            hourly = hourly[0]
+
+            DMI_u10, DMI_v10 = wind_components(hourly['DMI_wind_speed'], hourly['DMI_wind_dir'])
+            alpha = pd.DataFrame({'alpha': signed_angle(hourly['ERA5_ug'], hourly['ERA5_vg'], DMI_u10, DMI_v10).astype(np.float32)},
+                                 index=hourly.index)
+            write_station('ageo_hourly', station, alpha, replace='years')       #Station-year partitions in "dmi_dataset/ageo_hourly"
+
+            means = rollups(alpha, freq='1H', directions={'alpha': None}, min_coverage=min_coverage)
+            for means_period, collected in ((means['monthly'], alpha_monthly), (means['yearly'], alpha_yearly)):
+                means_period['alpha'] = (means_period['alpha'] + 180) % 360 - 180          #mean angle in [-180, 180)
+                collected.append(means_period)
+
+        if len(alpha_monthly) > 0:
+            write_station('ageo_hourly_monthly', station, pd.concat(alpha_monthly))
+            write_station('ageo_hourly_yearly', station, pd.concat(alpha_yearly))
+            print('Stored hourly alpha for station', station)
@@ -0,0 +1,94 @@
+##### Benchmark of the DMI download stage #####
+
+## This script measures the throughput of the DMI downloader ("dmi_downloader.py") against the local mock API ("mock_dmi_server.py"),
+## so that changes to the download stage can be compared without network access or an API-key.
+## For each configuration it reports requests per second, downloaded rows per second and the peak memory (RSS) of the downloader.
+## Each configuration runs in its own process so that the peak memory of one run does not carry over to the next.
+## The mock caches its responses and a warm-up run fills the cache, so the timings are not limited by generating the synthetic data.
+
+
+# Import packages:
+import time
+import json
+import multiprocessing as mp
+import requests
+import pandas as pd
+import mock_dmi_server
+from dmi_downloader import download_stations
+
+
+## Set adjustables:
+stations = ['06041', '06052', '06058', '06079']     #stations to download
+parameter = ['wind_speed', 'wind_dir']              #parameters to download
+start_datetime = '2020-01-01T00:00:00Z'             #period to download
+end_datetime = '2022-12-31T23:59:59Z'
+
+# Mock API settings:
+latency = 0.05                              #seconds added to every response
+page_limit = 100000                         #maximum number of returned observations per request
+throttle_rate = None                        #requests per second before the mock answers 429 (None for no throttling)
+
+# Downloader configurations to compare:
+configurations = [{'max_workers': 1, 'requests_per_second': None},
+                  {'max_workers': 4, 'requests_per_second': None},
+                  {'max_workers': 8, 'requests_per_second': None}]
+
+
+
+## Peak memory (RSS) of this process in MB:
+    #Read from /proc since ru_maxrss of a spawned process also counts the memory of the parent before the new program was loaded.
+def read_peak_rss():
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1]) / 1024                  #VmHWM is in kB
+    return float('nan')
+
+
+## Run one configuration and put the results in the queue (runs in a separate process):
+def run_configuration(base_url, configuration, queue):
+    job_list = [(station, p) for station in stations for p in parameter]
+    t_start = time.perf_counter()
+    rows = 0
+    windows = 0
+    for mode, resp_list in download_stations(job_list, start_datetime, end_datetime, api_key='mock', base_url=base_url,
+                                             max_observations=page_limit, **configuration):
+        rows = rows + sum(len(resp) for resp in resp_list)
+        windows = windows + len(resp_list)
+    elapsed = time.perf_counter() - t_start
+    peak_rss = read_peak_rss()
+    queue.put({'elapsed': elapsed, 'rows': rows, 'windows': windows, 'peak_rss_MB': peak_rss})
+
+
+if __name__ == '__main__':
+    server = mock_dmi_server.start_server(port=0, latency=latency, page_limit=page_limit, throttle_rate=throttle_rate, cache_responses=True)
+    base_url = mock_dmi_server.server_base_url(server)
+    stats_url = 'http://%s:%d/stats' % server.server_address
+    ctx = mp.get_context('spawn')
+
+    results = []
+    for configuration in [configurations[0]] + configurations:     #the first run is a warm-up
+        stats_before = requests.get(stats_url).json()
+        queue = ctx.Queue()
+        process = ctx.Process(target=run_configuration, args=(base_url, configuration, queue))
+        process.start()
+        result = queue.get()
+        process.join()
+        stats_after = requests.get(stats_url).json()
+
+        n_requests = stats_after['requests'] - stats_before['requests']            #including throttled requests
+        result.update(configuration)
+        result['requests'] = n_requests
+        result['throttled'] = stats_after['throttled'] - stats_before['throttled']
+        result['requests_per_s'] = n_requests / result['elapsed']
+        result['rows_per_s'] = result['rows'] / result['elapsed']
+        results.append(result)
+        print(json.dumps(result))
+    results = results[1:]                                           #drop the warm-up run
+
+    server.shutdown()
+
+    # Create dataframe with the results:
+    results_df = pd.DataFrame(results)[['max_workers', 'requests_per_second', 'elapsed', 'requests', 'throttled', 'windows', 'rows',
+                                        'requests_per_s', 'rows_per_s', 'peak_rss_MB']]
+    print(results_df.to_string(index=False))
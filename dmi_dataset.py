@@ -0,0 +1,123 @@
+##### DMI dataset #####
+
+## This module stores the station tables of all scripts (aligned DMI data, station locations, DMI/ERA5 means, ...) in one parquet
+## dataset per table instead of one gzip-file per station. Each dataset is partitioned by station and year in hive-style directories
+## (e.g. "dmi_dataset/dmi_data/Station_ID=06041/year=1990/part-0.parquet"), compressed with zstd and written with row-group
+## statistics, so that reading a few stations, years or columns only opens and decompresses the parts that are needed.
+
+
+# Import packages:
+import os
+import shutil
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds        # For partitioned parquet datasets
+
+
+## Set adjustables:
+dataset_dir = 'dmi_dataset'                 #directory holding all datasets
+rows_per_group = 16384                      #rows per row group (about 4 months of 10 min data)
+
+partition_fields = {'Station_ID': pa.string(), 'year': pa.int32()}     #types of the partition keys (keeps the leading zeros of station IDs)
+
+
+
+## Hive partitioning on the given keys:
+def partitioning(partition_by):
+    return ds.partitioning(pa.schema([(key, partition_fields[key]) for key in partition_by]), flavor='hive')
+
+
+## Partition directories ("<key>=<value>") in a directory, sorted:
+    #Other entries (e.g. ".DS_Store" or stray files) are skipped.
+def partition_dirs(path, key):
+    return sorted(part for part in os.listdir(path) if part.startswith(key + '=') and os.path.isdir(os.path.join(path, part)))
+
+
+## Write the table of one station to a dataset, replacing what was stored for the station before:
+    #The dataframe is either indexed by time ("Time") or has no time index (e.g. the station locations). Tables with a time index are
+    #partitioned by station and year and sorted by time within each file, tables without one are partitioned by station only.
+    #With replace='years' only the years in the dataframe are replaced and other stored years are kept (for writing a long series
+    #one year at a time).
+def write_station(name, station, df, root=dataset_dir, replace='station'):
+    if isinstance(df.index, pd.DatetimeIndex):
+        df = df.sort_index()
+        df = df.reset_index().rename(columns={df.index.name or 'index': 'Time'})
+        df['year'] = df['Time'].dt.year.astype('int32')
+        partition_by = ['Station_ID', 'year']
+    else:
+        df = df.reset_index(drop=True)
+        partition_by = ['Station_ID']
+    df['Station_ID'] = str(station)
+
+    station_dir = os.path.join(root, name, 'Station_ID=' + str(station))
+    if replace == 'years' and 'year' in df:
+        for year in df['year'].unique():                            #remove the stored parts of the years that are written
+            year_dir = os.path.join(station_dir, 'year=' + str(year))
+            if os.path.exists(year_dir):
+                shutil.rmtree(year_dir)
+    elif os.path.exists(station_dir):                               #remove years that are no longer in the table
+        shutil.rmtree(station_dir)
+
+    file_options = ds.ParquetFileFormat().make_write_options(compression='zstd', write_statistics=True)
+    ds.write_dataset(pa.Table.from_pandas(df, preserve_index=False), os.path.join(root, name), format='parquet',
+                     partitioning=partitioning(partition_by), file_options=file_options, basename_template='part-{i}.parquet',
+                     max_rows_per_group=rows_per_group, existing_data_behavior='overwrite_or_ignore')
+
+
+## Read stations, a time range and a subset of columns from a dataset:
+    #Only the partitions of the requested stations and years are opened, and only the requested columns are decompressed.
+    #start and end (both inclusive) may be time strings or timestamps, stations=None reads all stations.
+    #Returns a dataframe indexed by time (if the dataset has a "Time" column) with a "Station_ID" column.
+def read_dataset(name, stations=None, start=None, end=None, columns=None, root=dataset_dir):
+    path = os.path.join(root, name)
+    if not os.path.exists(path) or len(partition_dirs(path, 'Station_ID')) == 0:
+        return pd.DataFrame()
+    station_dir = os.path.join(path, partition_dirs(path, 'Station_ID')[0])     #tables with a time index are also partitioned by year
+    partition_by = ['Station_ID', 'year'] if len(partition_dirs(station_dir, 'year')) > 0 else ['Station_ID']
+    dataset = ds.dataset(path, format='parquet', partitioning=partitioning(partition_by))
+    has_time = 'Time' in dataset.schema.names
+
+    # Time as a scalar of the stored type (naive times are taken as UTC):
+    def timestamp(time):
+        time = pd.Timestamp(time)
+        time = time.tz_localize('UTC') if time.tz is None else time
+        return time, pa.scalar(time, type=dataset.schema.field('Time').type)
+
+    row_filter = None
+    def add(condition):
+        return condition if row_filter is None else row_filter & condition
+    if stations is not None:
+        row_filter = add(ds.field('Station_ID').isin([str(station) for station in stations]))
+    if start is not None and has_time:
+        start, start_scalar = timestamp(start)
+        row_filter = add((ds.field('year') >= start.year) & (ds.field('Time') >= start_scalar))
+    if end is not None and has_time:
+        end, end_scalar = timestamp(end)
+        row_filter = add((ds.field('year') <= end.year) & (ds.field('Time') <= end_scalar))
+
+    if columns is not None:
+        columns = (['Time'] if has_time else []) + [column for column in columns if column not in ('Time', 'Station_ID')] + ['Station_ID']
+    else:
+        columns = [column for column in dataset.schema.names if column != 'year']
+    df = dataset.to_table(columns=columns, filter=row_filter).to_pandas()
+    if has_time:
+        df = df.set_index('Time').sort_index()
+    return df
+
+
+## Read one station from a dataset as a list holding its dataframe, or an empty list if the station is not stored:
+    #Used by the scripts that loop over the stations, in place of searching for a station specific file.
+def station_frames(name, station, start=None, end=None, columns=None, root=dataset_dir):
+    df = read_dataset(name, [station], start, end, columns, root)
+    if len(df) == 0:
+        return []
+    return [df.drop(columns='Station_ID')]
+
+
+## Years stored for a station in a dataset partitioned by station and year (empty if the station is not stored):
+    #Used to process long time series one station-year at a time.
+def station_years(name, station, root=dataset_dir):
+    station_dir = os.path.join(root, name, 'Station_ID=' + str(station))
+    if not os.path.exists(station_dir):
+        return []
+    return sorted(int(part.split('=')[1]) for part in partition_dirs(station_dir, 'year'))
@@ -0,0 +1,416 @@
+##### DMI downloader #####
+
+## This module holds the request construction and the download machinery for DMIs metObs API used by
+## "template_dmi_download_superloop.py". Requests are sent from a thread pool sharing one keep-alive session, with a limit on
+## the number of simultaneous requests and a budget for the number of requests per second.
+## Each station and parameter is downloaded in time windows that adapt to the density of the data, so that no window is
+## truncated by the limit of returned observations and sparse periods are fetched with few requests.
+## A download manifest records what is already stored locally, so that later runs only request new observations and
+## interrupted runs continue from the last completed window.
+## Responses are parsed while they stream in (see "dmi_parser.py") and handled as Arrow tables with one row per observation.
+## Raw responses can be kept in a local cache, so that re-runs read closed historical windows from disk instead of the API.
+
+
+# Import packages:
+import os
+import json
+import time
+import gzip
+import hashlib
+import threading
+from urllib.parse import urlsplit, parse_qsl, urlencode
+from datetime import datetime, timedelta, timezone
+import requests                     # For making web requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from dmi_parser import read_response     # Streaming JSON to Arrow parser
+
+
+
+### Create request string for DMIs API service:
+
+# Create basic string fragments:
+base_url = 'https://dmigw.govcloud.dk/v2/metObs/collections/observation'
+max_observations = 300000                          #maximum number of returned observations
+limit = '/items?limit=' + str(max_observations)
+sort = '&sortorder=observed,DESC'                  #sorts request with descending time
+
+
+## Build the request string for one station, parameter and time period:
+    #This is the only place request URLs are put together, all download modes go through it.
+def create_request(station, parameter, date_time, api_key, base_url=base_url, limit=limit):
+    stationID = '&stationId=' + str(station)                    #Create call for station ID
+    date_time = '&datetime=' + str(date_time)                   #Returns observations between two dates. Both dates are inclusive.
+    parameterId = '&parameterId=' + parameter
+    API = '&api-key=' + api_key
+    return base_url + limit + stationID + date_time + parameterId + sort + API      #Create request string
+
+
+## Convert between API time strings and datetimes:
+def parse_time(time_string):
+    return datetime.fromisoformat(time_string.replace('Z', '+00:00'))
+
+def format_time(time):
+    return time.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+
+### Rate limiting:
+
+## Token bucket shared by all download threads:
+    #Allows bursts of up to "burst" requests and refills with "rate" requests per second. rate=None disables the budget.
+class RateLimiter:
+    def __init__(self, rate=None, burst=1):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate is None:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)     #refill bucket
+                self.last = now
+                if self.tokens >= 1:
+                    self.tokens = self.tokens - 1
+                    return
+                wait = (1 - self.tokens) / self.rate                #time until the next token is available
+            time.sleep(wait)
+
+
+
+### Session and single requests:
+
+## Create a keep-alive session with a connection pool large enough for all download threads:
+def create_session(max_workers=8):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+## Make one web request, retrying when the API throttles (429) or fails temporarily (5xx):
+    #The response body is parsed while it is streamed and returned as an Arrow table (see "dmi_parser.py").
+    #With a cache (see "ResponseCache") a valid cached response is read from disk instead, and new responses are written to the
+    #cache while they are parsed.
+def fetch(session, request, rate_limiter=None, retries=5, backoff=1.0, timeout=300, cache=None):
+    if cache is not None:
+        cache_file = cache.lookup(request)
+        if cache_file is not None:
+            with gzip.open(cache_file, 'rb') as f:
+                return read_response(f)
+
+    for attempt in range(retries + 1):
+        if rate_limiter is not None:
+            rate_limiter.acquire()                                  #wait for the rate-limit budget
+        r = session.get(str(request), timeout=timeout, stream=True)
+        if r.status_code != 429 and r.status_code < 500 or attempt == retries:
+            break
+        retry_after = r.headers.get('Retry-After')                  #honour the API´s own back-off if it gives one
+        if retry_after is not None and retry_after.replace('.', '', 1).isdigit():
+            wait = float(retry_after)
+        else:
+            wait = backoff * 2**attempt
+        r.close()
+        time.sleep(wait)
+    try:
+        r.raise_for_status()                                        #check if response was sucessful
+        r.raw.decode_content = True                                 #let urllib3 undo any gzip transfer encoding
+        if cache is not None and cache.storable(request):
+            return cache.store(request, r.raw)
+        return read_response(r.raw)                                 #convert response stream to table
+    finally:
+        r.close()
+
+
+
+### Response cache:
+
+## Copy everything read from a stream into a file (used to cache a response while it is parsed):
+class TeeReader:
+    def __init__(self, stream, file):
+        self.stream = stream
+        self.file = file
+
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        self.file.write(data)
+        return data
+
+
+## Local cache of raw API responses, stored as gzip-files named by a hash of the request:
+    #The key is the request URL without the API-key and with sorted query parameters, so the same request hits the same file
+    #whatever key or parameter order was used. Windows that end before the current year are closed and never change, so they are
+    #cached for good. Open windows (including open ended "start/.." requests) are only reused for "ttl" after they were downloaded,
+    #and not cached at all with ttl=None. "ttl" is a timedelta.
+    #The raw response is cached rather than the parsed table, so that cached responses are still valid after changes to the parser.
+class ResponseCache:
+    def __init__(self, cache_dir='dmi_response_cache', ttl=None):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        os.makedirs(cache_dir, exist_ok=True)
+
+    # Normalized request URL, without the API-key:
+    def normalize(self, request):
+        url = urlsplit(str(request))
+        query = sorted((key, value) for key, value in parse_qsl(url.query, keep_blank_values=True) if key != 'api-key')
+        return url.scheme.lower() + '://' + url.netloc.lower() + url.path + '?' + urlencode(query)
+
+    def path(self, request):
+        key = hashlib.sha256(self.normalize(request).encode()).hexdigest()
+        return os.path.join(self.cache_dir, key[:2], key + '.json.gz')
+
+    # Check if the requested time window is closed (ends before the start of the current year):
+    def immutable(self, request):
+        date_time = dict(parse_qsl(urlsplit(str(request)).query)).get('datetime', '..')
+        last = date_time.split('/')[-1]
+        if last in ('', '..'):
+            return False
+        current_year = datetime(datetime.now(timezone.utc).year, 1, 1, tzinfo=timezone.utc)
+        return parse_time(last) < current_year
+
+    def storable(self, request):
+        return self.ttl is not None or self.immutable(request)
+
+    # Return the cache file for a request if it holds a valid response, otherwise None:
+    def lookup(self, request):
+        cache_file = self.path(request)
+        if not os.path.exists(cache_file):
+            return None
+        if self.immutable(request):
+            return cache_file
+        if self.ttl is not None and time.time() - os.path.getmtime(cache_file) < self.ttl.total_seconds():
+            return cache_file
+        return None
+
+    # Parse a response stream and write it to the cache at the same time:
+        #The file is only moved into place once the whole response has been read and parsed.
+    def store(self, request, stream):
+        cache_file = self.path(request)
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        tmp_file = cache_file + '.' + str(threading.get_ident()) + '.tmp'
+        try:
+            with gzip.open(tmp_file, 'wb', compresslevel=6) as f:
+                resp = read_response(TeeReader(stream, f))
+            os.replace(tmp_file, cache_file)
+        finally:
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+        return resp
+
+
+
+### Adaptive time windows:
+
+## Download all observations for one station and parameter between start and end (both inclusive):
+    #The period is walked from the newest to the oldest observation. A window that comes back full is not trusted to be complete:
+    #since the API sorts by descending time, the response holds the newest part of the window, so the observations at the oldest
+    #returned timestamp are dropped and the rest of the window is requested from that timestamp (next page). 
+    #After each window the size of the next window is set from the observed density so that it fills about "fill" of the limit,
+    #which gives fewer and fuller requests for sparse stations and smaller windows for dense ones.
+    #If end is None the request is open ended ("start/..") which is used to fetch only new observations.
+    #"on_window" is called after each completed window with the response and the time where the next window will end.
+    #Returns a list of responses (Arrow tables) in descending time order.
+def download_period(session, station, parameter, start, end, api_key, rate_limiter=None, window=timedelta(days=5*365),
+                    max_window=timedelta(days=40*365), fill=0.8, max_observations=max_observations, base_url=base_url,
+                    on_window=None, **fetch_kwargs):
+    start = parse_time(start) if isinstance(start, str) else start
+    stop = parse_time(end) if isinstance(end, str) else end
+    limit = '/items?limit=' + str(max_observations)
+    resp_list = []
+
+    while stop is None or stop >= start:
+        if stop is None:                                            #open ended request for new observations
+            first = start
+            date_time = format_time(first) + '/..'
+        else:
+            first = max(start, stop - window)
+            date_time = format_time(first) + '/' + format_time(stop)
+        request = create_request(station, parameter, date_time, api_key, base_url=base_url, limit=limit)
+        resp = fetch(session, request, rate_limiter, **fetch_kwargs)
+
+        if len(resp) >= max_observations:                          #window is full and may be truncated
+            oldest = resp['Time'][-1]
+            resp = resp.filter(pc.not_equal(resp['Time'], oldest))  #drop the possibly incomplete oldest timestamp
+            oldest = oldest.as_py()
+            if len(resp) == 0 or stop is not None and oldest >= stop:
+                raise RuntimeError('More than ' + str(max_observations) + ' observations at ' + format_time(oldest) + ' for station ' + str(station))
+            resp_list.append(resp)
+            if stop is not None:
+                window = stop - oldest                              #this is roughly what fits into one request
+            stop = oldest                                           #continue with the rest of the window
+            if on_window is not None:
+                on_window(resp, stop)
+            continue
+
+        resp_list.append(resp)
+        if len(resp) == 0:                                          #no data: try a larger window next time
+            window = window * 2
+        else:                                                       #scale window to the observed density
+            window = (stop - first) * (fill * max_observations / len(resp)) if stop is not None else window
+        window = min(max(window, timedelta(hours=1)), max_window)
+        stop = first - timedelta(seconds=1)                         #dates are inclusive, continue just before this window
+        if on_window is not None:
+            on_window(resp, stop)
+
+    return resp_list
+
+
+
+### Download manifest:
+
+## Record of what has been downloaded, stored as a JSON-file next to the parquet-files:
+    #For each station and parameter the manifest holds
+    #   "last_observed": the newest "properties.observed" timestamp stored in the local parquet-file,
+    #   "resume_stop":   for an interrupted download, the time where the next window should end,
+    #   "windows":       spool files holding the windows that the interrupted download already completed.
+class DownloadManifest:
+    def __init__(self, filename='dmi_download_manifest.json', spool_dir='dmi_download_spool'):
+        self.filename = filename
+        self.spool_dir = spool_dir
+        self.lock = threading.Lock()
+        self.entries = {}
+        if os.path.exists(filename):
+            with open(filename) as f:
+                self.entries = json.load(f)
+
+    def key(self, station, parameter):
+        return str(station) + '/' + parameter
+
+    def get(self, station, parameter):
+        with self.lock:
+            return dict(self.entries.get(self.key(station, parameter), {}))
+
+    # Write the manifest to disk (the caller holds the lock):
+        #The file is replaced in one step so an interrupted run never leaves a half written manifest.
+    def save(self):
+        tmp_file = self.filename + '.tmp'
+        with open(tmp_file, 'w') as f:
+            json.dump(self.entries, f, indent=1, sort_keys=True)
+        os.replace(tmp_file, self.filename)
+
+    # Spool one completed window to disk and remember where the download continues:
+    def store_window(self, station, parameter, resp, resume_stop):
+        os.makedirs(self.spool_dir, exist_ok=True)
+        with self.lock:
+            entry = self.entries.setdefault(self.key(station, parameter), {})
+            spool_file = os.path.join(self.spool_dir, str(station) + '_' + parameter + '_' + str(len(entry.get('windows', []))) + '.parquet')
+        pq.write_table(resp, spool_file)
+        with self.lock:
+            entry.setdefault('windows', []).append(spool_file)
+            entry['resume_stop'] = format_time(resume_stop)
+            self.save()
+
+    # Read the windows spooled by an interrupted download:
+    def load_windows(self, station, parameter):
+        resp_list = []
+        for spool_file in self.get(station, parameter).get('windows', []):
+            resp_list.append(pq.read_table(spool_file))
+        return resp_list
+
+    # Remove the spooled windows of a station and parameter (the caller holds the lock):
+    def clear_windows(self, entry):
+        for spool_file in entry.pop('windows', []):
+            if os.path.exists(spool_file):
+                os.remove(spool_file)
+        entry.pop('resume_stop', None)
+
+    # Start a new full download for a station and parameter:
+    def restart(self, station, parameter):
+        with self.lock:
+            self.clear_windows(self.entries.setdefault(self.key(station, parameter), {}))
+            self.save()
+
+    # Mark a station and parameter as stored locally, after its parquet-file has been written:
+    def complete(self, station, parameter, resp_list):
+        newest = None
+        for resp in resp_list:
+            if len(resp) > 0:
+                observed = pc.max(resp['Time']).as_py()
+                if newest is None or observed > newest:
+                    newest = observed
+        with self.lock:
+            entry = self.entries.setdefault(self.key(station, parameter), {})
+            self.clear_windows(entry)
+            if newest is not None:
+                entry['last_observed'] = format_time(newest)
+            self.save()
+
+
+
+### Concurrent download:
+
+## Apply func to all items in a thread pool and yield the results in the order of the items:
+    #At most 2*max_workers results are submitted ahead of the one being consumed, which bounds the memory used by finished responses.
+def ordered_map(func, items, max_workers):
+    item_iter = iter(items)
+    pending = []                                                    #futures in item order
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for item in item_iter:                                      #fill up the prefetch window
+            pending.append(executor.submit(func, item))
+            if len(pending) >= 2*max_workers:
+                break
+        while pending:
+            result = pending.pop(0).result()
+            for item in item_iter:                                  #keep the window full
+                pending.append(executor.submit(func, item))
+                break
+            yield result
+
+
+## Download all requests and yield the responses in the same order as the requests:
+    #At most "max_workers" requests are in flight at once.
+    #"requests_per_second" sets the rate-limit budget shared by all threads (None for no budget).
+def download(request_list, max_workers=8, requests_per_second=None, session=None, **fetch_kwargs):
+    if session is None:
+        session = create_session(max_workers)
+    rate_limiter = RateLimiter(requests_per_second, burst=max_workers)
+    return ordered_map(lambda request: fetch(session, request, rate_limiter, **fetch_kwargs), request_list, max_workers)
+
+
+## Download whole periods for a list of (station, parameter) jobs with adaptive time windows:
+    #Jobs run concurrently, the windows of one job are requested one after another. For each job a tuple (mode, resp_list) is
+    #yielded in the order of job_list, where resp_list holds the responses from "download_period".
+    #With a manifest, jobs that are already stored locally are synced (mode='sync'): only observations newer than "last_observed"
+    #are requested and returned, to be appended to the stored data. All other jobs are full downloads (mode='full') that spool
+    #every completed window and continue from the last completed window if an earlier run was interrupted.
+    #"sync=False" ignores what is already stored and downloads the full period again.
+def download_stations(job_list, start, end, api_key, max_workers=8, requests_per_second=None, session=None, manifest=None,
+                      sync=True, **period_kwargs):
+    if session is None:
+        session = create_session(max_workers)
+    rate_limiter = RateLimiter(requests_per_second, burst=max_workers)
+    def download_job(job):
+        station, parameter = job
+        entry = manifest.get(station, parameter) if manifest is not None else {}
+
+        if sync and 'last_observed' in entry and 'resume_stop' not in entry:
+            last_observed = parse_time(entry['last_observed'])
+            resp_list = download_period(session, station, parameter, last_observed, None, api_key, rate_limiter, **period_kwargs)
+            last = pa.scalar(last_observed, pa.timestamp('us', tz='UTC'))
+            resp_list = [resp.filter(pc.greater(resp['Time'], last)) for resp in resp_list]     #the start of the request is inclusive, drop what is already stored
+            return 'sync', resp_list
+
+        on_window = None
+        resp_list = []
+        job_end = end
+        if manifest is not None:
+            if sync:                                                #continue an interrupted download
+                resp_list = manifest.load_windows(station, parameter)
+                job_end = entry.get('resume_stop', end)
+            else:
+                manifest.restart(station, parameter)
+            on_window = lambda resp, stop: manifest.store_window(station, parameter, resp, stop)
+        resp_list = resp_list + download_period(session, station, parameter, start, job_end, api_key, rate_limiter, 
+                                                on_window=on_window, **period_kwargs)
+        return 'full', resp_list
+    return ordered_map(download_job, job_list, max_workers)
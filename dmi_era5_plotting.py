@@ -8,13 +8,13 @@
 
 # Import packages:
 import pandas as pd
-import glob                                             #For searching files in current directory
+from dmi_dataset import station_frames                  #Station and year partitioned parquet datasets
+from dmi_trends import trend_table                      #Trends of all stations and variables at once
 import matplotlib
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates                       #for creating trendlines
 import numpy as np                                      #for creating trendlines
 
-import statsmodels.api as sm                            #for statistical analysis
 from statsmodels.graphics import tsaplots
 
 # Define list of DMI stations:
@@ -31,17 +31,31 @@ DMIstations = pd.DataFrame (stationlist, columns = ['Station_ID', 'Station_name'
 st_ID = list(DMIstations['Station_ID'])                                         #create list of all station IDs
 st_name = list(DMIstations['Station_name'])                                     #create list of all station names
 
+## Trends of all stations and variables:
+    #The trendlines, slopes and p-values of all plots are taken from one calculation for all monthly and one for all yearly series.
+trend_variables = ['DMI_wind_speed', 'ERA5_wind_speed', 'ERA5-DMI_wind_speed', 'DMI_wind_dir', 'ERA5_wind_dir']
+monthly_series, yearly_series = {}, {}
+for station in st_ID:
+    for name, series in (('DMI_ERA5_monthly', monthly_series), ('DMI_ERA5_yearly', yearly_series)):
+        for station_df in station_frames(name, station):
+            station_df['ERA5-DMI_wind_speed'] = station_df['ERA5_wind_speed'] - station_df['DMI_wind_speed']
+            for variable in trend_variables:
+                series[(station, variable)] = station_df[variable]
+monthly_trends = trend_table(monthly_series)
+yearly_trends = trend_table(yearly_series)
+
+
 ## Monthly plots:
+trends = monthly_trends
 st_name_nr = 0                                                                  #create initial counter for station names 
 
 for station in st_ID:
-    glob_string = 'DMI_ERA5_' + station + '_monthly.parq.gzip'                  #Create a dynamic string for input to search for station specific parquet-files
-    station_zip = glob.glob(glob_string)                                        #Find station specific parquet-files in current directory
+    station_zip = station_frames('DMI_ERA5_monthly', station)                   #Read station specific data from the dataset (empty if not stored)
     station_name = st_name[st_name_nr]                                          #Fetch station name
     st_name_nr = st_name_nr + 1                                                 #Counter for station names
     #print(station_name)
-    for i in station_zip:
-        station_parq_monthly = pd.read_parquet(i)                               #Read and print parquet-file
+    for station_df in station_zip:
+        station_parq_monthly = station_df                                       #Station specific dataframe
         #print(station_parq_monthly)
 
         ## Generate wind speed plot:
@@ -57,15 +71,14 @@ for station in st_ID:
         # Create trendlines:
         x1 = mdates.date2num(station_parq_monthly.index)                            #convert timeindex to numbers and define x-coordinate
         y1= station_parq_monthly['DMI_wind_speed']                                  #define y-coordinate
-        mask = y1.isna()                                                            #create mask for y-coordinate to avoid trendline disappearing for missing data
-        z1 = np.polyfit(x1[~mask], y1[~mask], 1)                                    #create least squares linear fit to coordinates
+        z1 = trends.loc[(station, y1.name), ['slope', 'intercept']].to_numpy()        #slope and intercept from the trends of all stations
         slope_DMI = np.round(z1[0],6)                                               #calculate the slope of the trendline and round it
         p1 = np.poly1d(z1)                                                          #create linear object
         ax.plot(x1, p1(x1), color='darkslateblue', linestyle='--', linewidth=2)     #plot trendline
 
         x2 = mdates.date2num(station_parq_monthly.index)
         y2= station_parq_monthly['ERA5_wind_speed']
-        z2 = np.polyfit(x2, y2, 1)
+        z2 = trends.loc[(station, y2.name), ['slope', 'intercept']].to_numpy()
         slope_ERA5 = np.round(z2[0],6)                                               #calculate the slope of the trendline and round it
         p2 = np.poly1d(z2)
         ax.plot(x2, p2(x2), color='crimson', linestyle='--', linewidth=2)
@@ -80,10 +93,8 @@ for station in st_ID:
 
 
         ## Regression analysis: 
-        x = sm.add_constant(x1)
-        results = sm.OLS(y1,x, missing = 'drop').fit()
         # print('Regression analysis for DMI wind speed station ' + station)
-        results.summary()
+        trends.loc[(station, y1.name)]                 #slope, intercept, standard error, p-value and R² of the trend
 
         fig = tsaplots.plot_acf(y1)                                                 #calculate autocorrelation
         plt.title('Autocorrelation for ' + station + " " + station_name)
@@ -96,14 +107,13 @@ for station in st_ID:
 st_name_nr = 0                                                                  #create initial counter for station names 
 
 for station in st_ID:
-    glob_string = 'DMI_ERA5_' + station + '_monthly.parq.gzip'                  #Create a dynamic string for input to search for station specific parquet-files
-    station_zip = glob.glob(glob_string)                                        #Find station specific parquet-files in current directory
+    station_zip = station_frames('DMI_ERA5_monthly', station)                   #Read station specific data from the dataset (empty if not stored)
     station_name = st_name[st_name_nr]                                          #Fetch station name
     st_name_nr = st_name_nr + 1                                                 #Counter for station names
     #print(station_name)
-    for i in station_zip:
-        station_parq_monthly = pd.read_parquet(i)                               #Read and print parquet-file
-        #station_parq_monthly = pd.read_parquet('DMI_ERA5_06058_monthly.parq.gzip')  
+    for station_df in station_zip:
+        station_parq_monthly = station_df                                       #Station specific dataframe
+        #station_parq_monthly = station_frames('DMI_ERA5_monthly', '06058')[0]  
         #print(station_parq_monthly)
 
         ## Calculate ERA5 - DMI wind speed:
@@ -125,8 +135,7 @@ for station in st_ID:
         # Create trendlines:
         x1 = mdates.date2num(station_parq_monthly.index)                            #convert timeindex to numbers and define x-coordinate
         y1= station_parq_monthly['ERA5-DMI_wind_speed']                                  #define y-coordinate
-        mask = y1.isna()                                                            #create mask for y-coordinate to avoid trendline disappearing for missing data
-        z1 = np.polyfit(x1[~mask], y1[~mask], 1)                                    #create least squares linear fit to coordinates
+        z1 = trends.loc[(station, y1.name), ['slope', 'intercept']].to_numpy()        #slope and intercept from the trends of all stations
         slope = np.round(z1[0],6)                                               #calculate the slope of the trendline and round it
         p1 = np.poly1d(z1)                                                          #create linear object
         ax.plot(x1, p1(x1), color='rebeccapurple', linestyle='--', linewidth=2)     #plot trendline
@@ -134,11 +143,8 @@ for station in st_ID:
         #Write the trendline slope in the upper left corner
         ax.text(0.02, 0.98, 'Trendline slope = ' + str(slope), color='rebeccapurple', style='italic',  horizontalalignment='left', verticalalignment='top', transform = ax.transAxes)
 
-        ## Conduct regression analysis: 
-        x = sm.add_constant(x1)
-        results = sm.OLS(y1,x, missing = 'drop').fit()
         #Write p-value under the trendline slope:
-        ax.text(0.02, 0.94, 'p-value = ' + str(np.round(results.f_pvalue,3)), color='rebeccapurple', style='italic',  horizontalalignment='left', verticalalignment='top', transform = ax.transAxes)
+        ax.text(0.02, 0.94, 'p-value = ' + str(np.round(trends.loc[(station, y1.name), 'p_value'],3)), color='rebeccapurple', style='italic',  horizontalalignment='left', verticalalignment='top', transform = ax.transAxes)
 
         #plt.show()                                                                 #display plot
         plt.savefig("monthly_ERA5-DMI_wind_speed_" + station + ".png", dpi=200)              #save plot as png
@@ -146,10 +152,8 @@ for station in st_ID:
 
 
         ## Regression analysis: 
-        x = sm.add_constant(x1)
-        results = sm.OLS(y1,x, missing = 'drop').fit()
         # print('Regression analysis for ERA5-DMI wind speed station ' + station)
-        #results.summary()
+        #trends.loc[(station, y1.name)]
         
         ## Plot autocorrelation plots:
         fig = tsaplots.plot_acf(y1, missing='none')
@@ -174,15 +178,14 @@ for station in st_ID:
         # Create trendlines:
         x1 = mdates.date2num(station_parq_monthly.index)                            #convert timeindex to numbers and define x-coordinate
         y1= station_parq_monthly['DMI_wind_dir']                                    #define y-coordinate
-        mask = y1.isna()                                                            #create mask for y-coordinate to avoid trendline disappearing for missing data
-        z1 = np.polyfit(x1[~mask], y1[~mask], 1)                                    #create least squares linear fit to coordinates
+        z1 = trends.loc[(station, y1.name), ['slope', 'intercept']].to_numpy()        #slope and intercept from the trends of all stations
         slope_DMI = np.round(z1[0],6)                                               #calculate the slope of the trendline and round it
         p1 = np.poly1d(z1)                                                          #create linear object
         ax.plot(x1, p1(x1), color='darkslateblue', linestyle='--', linewidth=2)     #plot trendline
 
         x2 = mdates.date2num(station_parq_monthly.index)
         y2= station_parq_monthly['ERA5_wind_dir']
-        z2 = np.polyfit(x2, y2, 1)
+        z2 = trends.loc[(station, y2.name), ['slope', 'intercept']].to_numpy()
         slope_ERA5 = np.round(z2[0],6)                                               #calculate the slope of the trendline and round it
         p2 = np.poly1d(z2)
         ax.plot(x2, p2(x2), color='crimson', linestyle='--', linewidth=2)
@@ -202,16 +205,16 @@ for station in st_ID:
 
 
 ## Yearly plots:
+trends = yearly_trends
 st_name_nr = 0                                                                  #create initial counter for station name
 
 for station in st_ID:
-    glob_string = 'DMI_ERA5_' + station + '_yearly.parq.gzip'                   #Create a dynamic string for input to search for station specific parquet-files
-    station_zip = glob.glob(glob_string)                                        #Find station specific parquet-files in current directory
+    station_zip = station_frames('DMI_ERA5_yearly', station)                    #Read station specific data from the dataset (empty if not stored)
     station_name = st_name[st_name_nr]                                          #Fetch station name
     st_name_nr = st_name_nr + 1                                                 #Counter for station names
     #print(station_name)
-    for i in station_zip:
-        station_parq_yearly = pd.read_parquet(i)                               #Read and print parquet-file
+    for station_df in station_zip:
+        station_parq_yearly = station_df                                       #Station specific dataframe
         #print(station_parq_monthly)
 
         ## Generate wind speed plot:
@@ -227,15 +230,14 @@ for station in st_ID:
         # Create trendlines:
         x1 = mdates.date2num(station_parq_yearly.index)                            #convert timeindex to numbers and define x-coordinate
         y1 = station_parq_yearly['DMI_wind_speed']                                  #define y-coordinate
-        mask = y1.isna()                                                            #create mask for y-coordinate to avoid trendline disappearing for missing data
-        z1 = np.polyfit(x1[~mask], y1[~mask], 1)                                    #create least squares linear fit to coordinates
+        z1 = trends.loc[(station, y1.name), ['slope', 'intercept']].to_numpy()        #slope and intercept from the trends of all stations
         slope_DMI = np.round(z1[0],6)                                               #calculate the slope of the trendline and round it
         p1 = np.poly1d(z1)                                                          #create linear object
         ax.plot(x1, p1(x1), color='darkslateblue', linestyle='--', linewidth=2)     #plot trendline
 
         x2 = mdates.date2num(station_parq_yearly.index)
         y2 = station_parq_yearly['ERA5_wind_speed']
-        z2 = np.polyfit(x2, y2, 1)
+        z2 = trends.loc[(station, y2.name), ['slope', 'intercept']].to_numpy()
         slope_ERA5 = np.round(z2[0],6)
         p2 = np.poly1d(z2)
         ax.plot(x2, p2(x2), color='crimson', linestyle='--', linewidth=2)
@@ -263,15 +265,14 @@ for station in st_ID:
         # Create trendlines:
         x1 = mdates.date2num(station_parq_yearly.index)                             #convert timeindex to numbers and define x-coordinate
         y1= station_parq_yearly['DMI_wind_dir']                                     #define y-coordinate
-        mask = y1.isna()                                                            #create mask for y-coordinate to avoid trendline disappearing for missing data
-        z1 = np.polyfit(x1[~mask], y1[~mask], 1)                                    #create least squares linear fit to coordinates
+        z1 = trends.loc[(station, y1.name), ['slope', 'intercept']].to_numpy()        #slope and intercept from the trends of all stations
         slope_DMI = np.round(z1[0],6)                                               #calculate the slope of the trendline and round it
         p1 = np.poly1d(z1)                                                          #create linear object
         ax.plot(x1, p1(x1), color='darkslateblue', linestyle='--', linewidth=2)     #plot trendline
 
         x2 = mdates.date2num(station_parq_yearly.index)
         y2= station_parq_yearly['ERA5_wind_dir']
-        z2 = np.polyfit(x2, y2, 1)
+        z2 = trends.loc[(station, y2.name), ['slope', 'intercept']].to_numpy()
         slope_ERA5 = np.round(z2[0],6)
         p2 = np.poly1d(z2)
         ax.plot(x2, p2(x2), color='crimson', linestyle='--', linewidth=2)
@@ -305,8 +306,7 @@ for station in st_ID:
         # Create trendlines:
         x1 = mdates.date2num(station_parq_yearly.index)                            #convert timeindex to numbers and define x-coordinate
         y1= station_parq_yearly['ERA5-DMI_wind_speed']                                  #define y-coordinate
-        mask = y1.isna()                                                            #create mask for y-coordinate to avoid trendline disappearing for missing data
-        z1 = np.polyfit(x1[~mask], y1[~mask], 1)                                    #create least squares linear fit to coordinates
+        z1 = trends.loc[(station, y1.name), ['slope', 'intercept']].to_numpy()        #slope and intercept from the trends of all stations
         slope = np.round(z1[0],6)                                               #calculate the slope of the trendline and round it
         p1 = np.poly1d(z1)                                                          #create linear object
         ax.plot(x1, p1(x1), color='rebeccapurple', linestyle='--', linewidth=2)     #plot trendline
@@ -314,11 +314,8 @@ for station in st_ID:
         #Write the trendline slope in the upper left corner
         ax.text(0.02, 0.98, 'Trendline slope = ' + str(slope), color='rebeccapurple', style='italic',  horizontalalignment='left', verticalalignment='top', transform = ax.transAxes)
 
-        ## Conduct regression analysis: 
-        x = sm.add_constant(x1)
-        results = sm.OLS(y1,x, missing = 'drop').fit()
         #Write p-value under the trendline slope:
-        ax.text(0.02, 0.94, 'p-value = ' + str(np.round(results.f_pvalue,3)), color='rebeccapurple', style='italic',  horizontalalignment='left', verticalalignment='top', transform = ax.transAxes)
+        ax.text(0.02, 0.94, 'p-value = ' + str(np.round(trends.loc[(station, y1.name), 'p_value'],3)), color='rebeccapurple', style='italic',  horizontalalignment='left', verticalalignment='top', transform = ax.transAxes)
 
         #plt.show()                                                                 #display plot
         plt.savefig("yearly_ERA5-DMI_wind_speed_" + station + ".png", dpi=200)              #save plot as png
@@ -326,10 +323,8 @@ for station in st_ID:
 
 
         ## Regression analysis: 
-        x = sm.add_constant(x1)
-        results = sm.OLS(y1,x, missing = 'drop').fit()
         # print('Regression analysis for ERA5-DMI wind speed station ' + station)
-        results.summary()
+        trends.loc[(station, y1.name)]                 #slope, intercept, standard error, p-value and R² of the trend
 
         ## Plot autocorrelation plots:
         # fig = tsaplots.plot_acf(y1, missing='none')
@@ -359,18 +354,18 @@ movingdate = list(mdates.date2num(moved_DMIstations['Moving date']))
 
 
 ## ERA5 and DMI data plot:
+trends = monthly_trends
 
 st_name_nr = 0                                                                  #create initial counter for station names 
 
 for station in moved_st_ID:
-    glob_string = 'DMI_ERA5_' + station + '_monthly.parq.gzip'                  #Create a dynamic string for input to search for station specific parquet-files
-    station_zip = glob.glob(glob_string)                                        #Find station specific parquet-files in current directory
+    station_zip = station_frames('DMI_ERA5_monthly', station)                   #Read station specific data from the dataset (empty if not stored)
     station_name = moved_st_name[st_name_nr]                                    #Fetch station name
     move_date = movingdate[st_name_nr]                                          #fetch moving date
     st_name_nr = st_name_nr + 1                                                 #Counter for station names
     #print(station_name)
-    for i in station_zip:
-        station_parq_monthly = pd.read_parquet(i)                               #Read and print parquet-file
+    for station_df in station_zip:
+        station_parq_monthly = station_df                                       #Station specific dataframe
         #print(station_parq_monthly)
 
         ## Generate wind speed plot:
@@ -386,15 +381,14 @@ for station in moved_st_ID:
         # Create trendlines:
         x1 = mdates.date2num(station_parq_monthly.index)                            #convert timeindex to numbers and define x-coordinate
         y1= station_parq_monthly['DMI_wind_speed']                                  #define y-coordinate
-        mask = y1.isna()                                                            #create mask for y-coordinate to avoid trendline disappearing for missing data
-        z1 = np.polyfit(x1[~mask], y1[~mask], 1)                                    #create least squares linear fit to coordinates
+        z1 = trends.loc[(station, y1.name), ['slope', 'intercept']].to_numpy()        #slope and intercept from the trends of all stations
         slope_DMI = np.round(z1[0],6)                                               #calculate the slope of the trendline and round it
         p1 = np.poly1d(z1)                                                          #create linear object
         ax.plot(x1, p1(x1), color='darkslateblue', linestyle='--', linewidth=2)     #plot trendline
 
         x2 = mdates.date2num(station_parq_monthly.index)
         y2= station_parq_monthly['ERA5_wind_speed']
-        z2 = np.polyfit(x2, y2, 1)
+        z2 = trends.loc[(station, y2.name), ['slope', 'intercept']].to_numpy()
         slope_ERA5 = np.round(z2[0],6)                                               #calculate the slope of the trendline and round it
         p2 = np.poly1d(z2)
         ax.plot(x2, p2(x2), color='crimson', linestyle='--', linewidth=2)
@@ -419,14 +413,13 @@ for station in moved_st_ID:
 st_name_nr = 0                                                                  #create initial counter for station names 
 
 for station in moved_st_ID:
-    glob_string = 'DMI_ERA5_' + station + '_monthly.parq.gzip'                  #Create a dynamic string for input to search for station specific parquet-files
-    station_zip = glob.glob(glob_string)                                        #Find station specific parquet-files in current directory
+    station_zip = station_frames('DMI_ERA5_monthly', station)                   #Read station specific data from the dataset (empty if not stored)
     station_name = moved_st_name[st_name_nr]                                    #Fetch station name
     move_date = movingdate[st_name_nr]                                          #fetch moving date
     st_name_nr = st_name_nr + 1                                                 #Counter for station names
     #print(station_name)
-    for i in station_zip:
-        station_parq_monthly = pd.read_parquet(i)                               #Read and print parquet-file
+    for station_df in station_zip:
+        station_parq_monthly = station_df                                       #Station specific dataframe
 
         ## Calculate ERA5 - DMI wind speed:
         ERA5_DMI_list = []
@@ -447,8 +440,7 @@ for station in moved_st_ID:
         # Create trendlines:
         x1 = mdates.date2num(station_parq_monthly.index)                            #convert timeindex to numbers and define x-coordinate
         y1= station_parq_monthly['ERA5-DMI_wind_speed']                                  #define y-coordinate
-        mask = y1.isna()                                                            #create mask for y-coordinate to avoid trendline disappearing for missing data
-        z1 = np.polyfit(x1[~mask], y1[~mask], 1)                                    #create least squares linear fit to coordinates
+        z1 = trends.loc[(station, y1.name), ['slope', 'intercept']].to_numpy()        #slope and intercept from the trends of all stations
         slope = np.round(z1[0],6)                                               #calculate the slope of the trendline and round it
         p1 = np.poly1d(z1)                                                          #create linear object
         ax.plot(x1, p1(x1), color='rebeccapurple', linestyle='--', linewidth=2)     #plot trendline
@@ -456,11 +448,8 @@ for station in moved_st_ID:
         #Write the trendline slope in the upper left corner
         ax.text(0.02, 0.98, 'Trendline slope = ' + str(slope), color='rebeccapurple', style='italic',  horizontalalignment='left', verticalalignment='top', transform = ax.transAxes)
 
-        ## Conduct regression analysis: 
-        x = sm.add_constant(x1)
-        results = sm.OLS(y1,x, missing = 'drop').fit()
         #Write p-value under the trendline slope:
-        ax.text(0.02, 0.94, 'p-value = ' + str(np.round(results.f_pvalue,3)), color='rebeccapurple', style='italic',  horizontalalignment='left', verticalalignment='top', transform = ax.transAxes)
+        ax.text(0.02, 0.94, 'p-value = ' + str(np.round(trends.loc[(station, y1.name), 'p_value'],3)), color='rebeccapurple', style='italic',  horizontalalignment='left', verticalalignment='top', transform = ax.transAxes)
 
         ## Add line of moving date:
         ax.vlines(move_date, ymin=-1, ymax=14, color='black', linestyle='dotted',linewidth=2)
@@ -468,3 +457,34 @@ for station in moved_st_ID:
         #plt.show()                                                                 #display plot
         plt.savefig("monthly_ERA5-DMI_wind_speed_movedate_" + station + ".png", dpi=200)              #save plot as png
         plt.close(None)
+
+
+
+
+## Direction sector plots:
+    #Mean ERA5-DMI wind speed difference for each DMI wind direction sector over all years, from the cube of "wind_sector_stats.py".
+st_name_nr = 0                                                                  #create initial counter for station names 
+
+for station in st_ID:
+    station_zip = station_frames('wind_rose_yearly', station)                   #Read station specific data from the dataset (empty if not stored)
+    station_name = st_name[st_name_nr]                                          #Fetch station name
+    st_name_nr = st_name_nr + 1                                                 #Counter for station names
+    for station_cube in station_zip:
+        # Combine all years and speed classes for each sector (means weighted by the number of hours):
+        weighted = station_cube['ERA5-DMI_wind_speed'].fillna(0) * station_cube['ERA5-DMI_wind_speed_count']
+        sector_sum = weighted.groupby(station_cube['Sector_center']).sum()
+        sector_count = station_cube['ERA5-DMI_wind_speed_count'].groupby(station_cube['Sector_center']).sum()
+        sector_mean = sector_sum / sector_count.replace(0, np.nan)
+
+        ## Generate polar bar plot:
+        fig = plt.figure(layout='constrained')
+        ax = fig.add_subplot(projection='polar')
+        ax.set_theta_zero_location('N')                                         #north at the top
+        ax.set_theta_direction(-1)                                              #clockwise, as the wind direction
+        width = 2*np.pi / len(sector_mean)
+        ax.bar(np.radians(sector_mean.index), sector_mean, width=width, color='mediumpurple', edgecolor='rebeccapurple')
+        ax.set_title("Mean ERA5-DMI wind speed [m/s] by DMI wind direction for station " + station + " " + station_name, fontsize=10)
+
+        #plt.show()                                                             #display plot
+        #plt.savefig("sector_ERA5-DMI_wind_speed_" + station + ".png", dpi=200)  #save plot as png
+        plt.close(None)
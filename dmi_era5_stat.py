@@ -2,18 +2,24 @@
 ## Author: Bianca E.Sandvik (March 2023)
 
 ## This script imports station specific parquet files and drops lines of data based on its recorded change in latitude and longitude. 
-## Whether it drops the lines before or after the station was moved can be adjusted by # or un-# certain codelines (see line 31-34).
-## It then generates time series plots and conduct a regression analysis for the new time series. 
+## Whether it drops the lines before or after the station was moved can be adjusted for each analysis (see "Set adjustables").
+## It then generates time series plots and conduct a regression analysis for the new time series. The trends of all stations are 
+## calculated at once for each analysis ("dmi_trends.py").
 
 
 # Import packages:
 import pandas as pd
-import glob                                             #For searching files in current directory
+from dmi_dataset import station_frames                  #Station and year partitioned parquet datasets
+from dmi_trends import location_period, trend_table     #Station move periods and trends of all stations at once
 import matplotlib
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates                       #for creating trendlines
 import numpy as np                                      #for creating trendlines
-import statsmodels.api as sm                            #for statistical analysis
+
+## Set adjustables:
+monthly_period = 'before'                               #rows used in the monthly analysis: 'before' or 'after' the station was moved
+alpha_period = 'after'                                  #rows used in the analysis of alpha
+yearly_period = 'after'                                 #rows used in the yearly analysis
 
 # Define list of DMI stations:
 stationlist = [('06041', 'Skagen Fyr'),('06052' ,"Thyborøn"), ('06058', "Hvide Sande"), ('06079', "Anholt Havn"), 
@@ -30,38 +36,32 @@ st_ID = list(DMIstations['Station_ID'])
 st_name = list(DMIstations['Station_name'])                                     #create list of all station names
 
 ## Monthly analysis:
-    ##NOTE: adjust run for two different time periods: 
-        ## Before station move: comment lines 41-42 and uncomment line 59
-        ## After station move:  uncomment lines 41-42 and comment line 58
+# Trends of all stations in one calculation:
+monthly_series = {}
+for station in st_ID:
+    for station_df in station_frames('DMI_ERA5_monthly', station):
+        unmoved_st = location_period(station_df, monthly_period)
+        monthly_series[(station, 'DMI_wind_speed')] = unmoved_st['DMI_wind_speed']
+        monthly_series[(station, 'ERA5_wind_speed')] = unmoved_st['ERA5_wind_speed']
+        monthly_series[(station, 'ERA5-DMI_wind_speed')] = unmoved_st['ERA5_wind_speed'] - unmoved_st['DMI_wind_speed']
+trends = trend_table(monthly_series)
 
 st_name_nr = 0                                                                  #create initial counter for station names 
 
 for station in st_ID:
-    glob_string = 'DMI_ERA5_' + station + '_monthly.parq.gzip'                  #Create a dynamic string for input to search for station specific parquet-files
-    station_zip = glob.glob(glob_string)                                        #Find station specific parquet-files in current directory
+    station_zip = station_frames('DMI_ERA5_monthly', station)                   #Read station specific data from the dataset (empty if not stored)
     station_name = st_name[st_name_nr]                                          #Fetch station name
     st_name_nr = st_name_nr + 1                                                 #Counter for station names
     #print(station_name)
-    for i in station_zip:
-        # if i == 'DMI_ERA5_06116_monthly.parq.gzip':                             #jump over itteration for station 06116
+    for station_df in station_zip:
+        # if station == '06116':                                                #jump over itteration for station 06116
         #    continue
            #Needed for run for NEW location since station has no values for new location yet
 
-        station_parq_monthly = pd.read_parquet(i)                               #Read and print parquet-file
+        station_parq_monthly = station_df                                       #Station specific dataframe
 
         ## Plot and regression for timeframe of unchanged station location:        
-        counter = 0                                                             #create counter for number of rows containing original location
-        for row in range(len(station_parq_monthly)):
-            if station_parq_monthly.DMI_Lon[row] == station_parq_monthly.DMI_Lon[0] and station_parq_monthly.DMI_Lat[row] == station_parq_monthly.DMI_Lat[0]:
-                counter = counter + 1
-                #If longitude or latitude match the original location, increase row counter
-            else:
-                pass
-
-        # Drop all rows in dataframe with data for original or last location 
-        #unmoved_st = station_parq_monthly.drop(station_parq_monthly.index[:counter+1])          #drop rows with old location
-        unmoved_st = station_parq_monthly.drop(station_parq_monthly.index[counter:])            #drop rows with new location
-            #NOTE: one month excluded from both due to potential transition values.
+        unmoved_st = location_period(station_parq_monthly, monthly_period)       #rows from before or after the station was moved
         
         if len(unmoved_st) == 0:                        #jump over itteration if new dataframe is empty
             continue
@@ -79,15 +79,14 @@ for station in st_ID:
         # Create trendlines:
         x1 = mdates.date2num(unmoved_st.index)                            #convert timeindex to numbers and define x-coordinate
         y1= unmoved_st['DMI_wind_speed']                                  #define y-coordinate
-        mask = y1.isna()                                                            #create mask for y-coordinate to avoid trendline disappearing for missing data
-        z1 = np.polyfit(x1[~mask], y1[~mask], 1)                                    #create least squares linear fit to coordinates
+        z1 = trends.loc[(station, y1.name), ['slope', 'intercept']].to_numpy()        #slope and intercept from the trends of all stations
         slope_DMI = np.round(z1[0],6)                                               #calculate the slope of the trendline and round it
         p1 = np.poly1d(z1)                                                          #create linear object
         ax.plot(x1, p1(x1), color='darkslateblue', linestyle='--', linewidth=2)     #plot trendline
 
         x2 = mdates.date2num(unmoved_st.index)
         y2= unmoved_st['ERA5_wind_speed']
-        z2 = np.polyfit(x2, y2, 1)
+        z2 = trends.loc[(station, y2.name), ['slope', 'intercept']].to_numpy()
         slope_ERA5 = np.round(z2[0],6)                                               #calculate the slope of the trendline and round it
         p2 = np.poly1d(z2)
         ax.plot(x2, p2(x2), color='crimson', linestyle='--', linewidth=2)
@@ -102,10 +101,8 @@ for station in st_ID:
 
 
         ## Regression analysis: 
-        # x = sm.add_constant(x1)
-        # results = sm.OLS(y1,x, missing = 'drop').fit()
-        # # print('Regression analysis for DMI wind speed station ' + station)
-        # results.summary()
+        # print('Regression analysis for DMI wind speed station ' + station)
+        # trends.loc[(station, y1.name)]
 
 
 
@@ -129,29 +126,23 @@ for station in st_ID:
         # Create trendlines:
         x1 = mdates.date2num(unmoved_st.index)                            #convert timeindex to numbers and define x-coordinate
         y1= unmoved_st['ERA5-DMI_wind_speed']                                  #define y-coordinate
-        mask = y1.isna()                                                            #create mask for y-coordinate to avoid trendline disappearing for missing data
-        z1 = np.polyfit(x1[~mask], y1[~mask], 1)                                    #create least squares linear fit to coordinates
+        z1 = trends.loc[(station, y1.name), ['slope', 'intercept']].to_numpy()        #slope and intercept from the trends of all stations
         slope = np.round(z1[0],6)                                               #calculate the slope of the trendline and round it
         p1 = np.poly1d(z1)                                                          #create linear object
         ax.plot(x1, p1(x1), color='rebeccapurple', linestyle='--', linewidth=2)     #plot trendline
 
-        ## Conduct regression analysis: 
-        x = sm.add_constant(x1)
-        results = sm.OLS(y1,x, missing = 'drop').fit()
 
         #Write the trendline slope in the upper left corner
         ax.text(0.02, 0.98, 'Trendline slope = ' + str(slope), color='rebeccapurple', style='italic',  horizontalalignment='left', verticalalignment='top', transform = ax.transAxes)
-        ax.text(0.02, 0.94, 'p-value = ' + str(np.round(results.f_pvalue,3)), color='rebeccapurple', style='italic',  horizontalalignment='left', verticalalignment='top', transform = ax.transAxes)
+        ax.text(0.02, 0.94, 'p-value = ' + str(np.round(trends.loc[(station, y1.name), 'p_value'],3)), color='rebeccapurple', style='italic',  horizontalalignment='left', verticalalignment='top', transform = ax.transAxes)
         plt.show()                                                                 #display plot
         #plt.savefig("monthly_ERA5-DMI_wind_speed_" + station + "before/after.png", dpi=200)              #save plot as png
         #plt.close(None)
 
 
         ## Regression analysis: 
-        x = sm.add_constant(x1)
-        results = sm.OLS(y1,x, missing = 'drop').fit()
         #print('Regression analysis for ERA5-DMI wind speed station ' + station)
-        results.summary()
+        trends.loc[(station, y1.name)]                 #slope, intercept, standard error, p-value and R² of the trend
 
 
 
@@ -160,7 +151,7 @@ for station in st_ID:
 ## Special analysis for station 06183 Drogden_Fyr:
 ## Height changed between 2019-01-15T13:34:47Z and 2022-04-04T12:41:04Z
 
-station_parq_monthly = pd.read_parquet('DMI_ERA5_06183_monthly.parq.gzip')
+station_parq_monthly = station_frames('DMI_ERA5_monthly', '06183')[0]
 
 # Plot and regression for timeframe of unchanged station location:
 counter = 0                                                             #create counter for number of rows containing previous location
@@ -173,6 +164,10 @@ for row in range(len(station_parq_monthly)):
 
 unmoved_st = station_parq_monthly.drop(station_parq_monthly.index[counter:len(station_parq_monthly)])       #drop all rows in dataframe with data for previous location   
 
+station = '06183'
+trends = trend_table({(station, 'DMI_wind_speed'): unmoved_st['DMI_wind_speed'], (station, 'ERA5_wind_speed'): unmoved_st['ERA5_wind_speed'],
+                      (station, 'ERA5-DMI_wind_speed'): unmoved_st['ERA5_wind_speed'] - unmoved_st['DMI_wind_speed']})
+
 
 
 ## Generate wind speed plot:
@@ -188,15 +183,14 @@ ax.legend(loc='upper right')                                                #def
 # Create trendlines:
 x1 = mdates.date2num(unmoved_st.index)                            #convert timeindex to numbers and define x-coordinate
 y1= unmoved_st['DMI_wind_speed']                                  #define y-coordinate
-mask = y1.isna()                                                            #create mask for y-coordinate to avoid trendline disappearing for missing data
-z1 = np.polyfit(x1[~mask], y1[~mask], 1)                                    #create least squares linear fit to coordinates
+z1 = trends.loc[(station, y1.name), ['slope', 'intercept']].to_numpy()        #slope and intercept from the trends of all stations
 slope_DMI = np.round(z1[0],6)                                               #calculate the slope of the trendline and round it
 p1 = np.poly1d(z1)                                                          #create linear object
 ax.plot(x1, p1(x1), color='darkslateblue', linestyle='--', linewidth=2)     #plot trendline
 
 x2 = mdates.date2num(unmoved_st.index)
 y2= unmoved_st['ERA5_wind_speed']
-z2 = np.polyfit(x2, y2, 1)
+z2 = trends.loc[(station, y2.name), ['slope', 'intercept']].to_numpy()
 slope_ERA5 = np.round(z2[0],6)                                               #calculate the slope of the trendline and round it
 p2 = np.poly1d(z2)
 ax.plot(x2, p2(x2), color='crimson', linestyle='--', linewidth=2)
@@ -211,10 +205,8 @@ plt.close(None)
 
 
 ## Regression analysis: 
-x = sm.add_constant(x1)
-results = sm.OLS(y1,x, missing = 'drop').fit()
 print('Regression analysis for DMI wind speed station ' + station)
-results.summary()
+trends.loc[(station, y1.name)]                 #slope, intercept, standard error, p-value and R² of the trend
 
 
 
@@ -238,8 +230,7 @@ ax.legend(loc='upper right')                                                #def
 # Create trendlines:
 x1 = mdates.date2num(unmoved_st.index)                            #convert timeindex to numbers and define x-coordinate
 y1= unmoved_st['ERA5-DMI_wind_speed']                                  #define y-coordinate
-mask = y1.isna()                                                            #create mask for y-coordinate to avoid trendline disappearing for missing data
-z1 = np.polyfit(x1[~mask], y1[~mask], 1)                                    #create least squares linear fit to coordinates
+z1 = trends.loc[(station, y1.name), ['slope', 'intercept']].to_numpy()        #slope and intercept from the trends of all stations
 slope = np.round(z1[0],6)                                               #calculate the slope of the trendline and round it
 p1 = np.poly1d(z1)                                                          #create linear object
 ax.plot(x1, p1(x1), color='rebeccapurple', linestyle='--', linewidth=2)     #plot trendline
@@ -253,43 +244,36 @@ plt.close(None)
 
 
 ## Regression analysis: 
-x = sm.add_constant(x1)
-results = sm.OLS(y1,x, missing = 'drop').fit()
-results.summary()
+trends.loc[(station, y1.name)]                 #slope, intercept, standard error, p-value and R² of the trend
 
 
 
 
 ## Analysis for alpha:
+# Trends of all stations in one calculation:
+alpha_series = {}
+for station in st_ID:
+    for station_df in station_frames('ageo_monthly', station):
+        alpha_series[(station, 'alpha')] = location_period(station_df, alpha_period)['alpha']
+trends = trend_table(alpha_series)
+
 st_name_nr = 0                                                                  #create initial counter for station names 
 
 for station in st_ID:
-    glob_string = 'ageo_' + station + '_monthly.parq.gzip'                      #Create a dynamic string for input to search for station specific parquet-files
-    station_zip = glob.glob(glob_string)                                        #Find station specific parquet-files in current directory
+    station_zip = station_frames('ageo_monthly', station)                       #Read station specific data from the dataset (empty if not stored)
     station_name = st_name[st_name_nr]                                          #Fetch station name
     st_name_nr = st_name_nr + 1                                                 #Counter for station names
     #print(station_name)
-    for i in station_zip:
-        if i == 'ageo_06116_monthly.parq.gzip':                             #jump over itteration for station 06116
+    for station_df in station_zip:
+        if station == '06116':                                                  #jump over itteration for station 06116
            continue
            #NOTE: Needed for run for NEW location since station has no values for new location yet
 
-        station_parq_monthly = pd.read_parquet(i)                               #Read and print parquet-file
-        #station_parq_monthly = pd.read_parquet('ageo_06080_monthly.parq.gzip')
+        station_parq_monthly = station_df                                       #Station specific dataframe
+        #station_parq_monthly = station_frames('ageo_monthly', '06080')[0]
 
         ## Plot and regression for timeframe of unchanged station location:        
-        counter = 0                                                             #create counter for number of rows containing original location
-        for row in range(len(station_parq_monthly)):
-            if station_parq_monthly.DMI_Lon[row] == station_parq_monthly.DMI_Lon[0] and station_parq_monthly.DMI_Lat[row] == station_parq_monthly.DMI_Lat[0]:
-                counter = counter + 1
-                #If longitude or latitude match the original location, increase row counter
-            else:
-                pass
-
-        # Drop all rows in dataframe with data for original or last location 
-        unmoved_st = station_parq_monthly.drop(station_parq_monthly.index[:counter+1])          #drop rows with old location
-        #unmoved_st = station_parq_monthly.drop(station_parq_monthly.index[counter:])            #drop rows with new location
-            #NOTE: one month excluded from both due to potential transition values.
+        unmoved_st = location_period(station_parq_monthly, alpha_period)       #rows from before or after the station was moved
         
         if len(unmoved_st) == 0:                        #jump over itteration if new dataframe is empty
             continue
@@ -306,8 +290,7 @@ for station in st_ID:
         # Create trendlines:
         x1 = mdates.date2num(unmoved_st.index)                                      #convert timeindex to numbers and define x-coordinate
         y1= unmoved_st['alpha']                                                     #define y-coordinate
-        mask = y1.isna()                                                    #create mask for y-coordinate to avoid trendline disappearing for missing data
-        z1 = np.polyfit(x1[~mask], y1[~mask], 1)                            #create least squares linear fit to coordinates
+        z1 = trends.loc[(station, y1.name), ['slope', 'intercept']].to_numpy()        #slope and intercept from the trends of all stations
         slope = np.round(z1[0],6)                                           #calculate the slope of the trendline and round it
         p1 = np.poly1d(z1)                                                  #create linear object
         ax.plot(x1, p1(x1), color='olive', linestyle='--', linewidth=2)     #plot trendline
@@ -319,9 +302,7 @@ for station in st_ID:
 
 
         ## Regression analysis: 
-        x = sm.add_constant(x1)
-        results = sm.OLS(y1,x, missing = 'drop').fit()
-        results.summary()
+        trends.loc[(station, y1.name)]                 #slope, intercept, standard error, p-value and R² of the trend
 
 
 
@@ -334,33 +315,31 @@ for station in st_ID:
 st_name_nr = 0  
 
 ## Yearly plots:
+# Trends of all stations in one calculation:
+yearly_series = {}
+for station in st_ID:
+    for station_df in station_frames('DMI_ERA5_yearly', station):
+        unmoved_st = location_period(station_df, yearly_period)
+        yearly_series[(station, 'DMI_wind_speed')] = unmoved_st['DMI_wind_speed']
+        yearly_series[(station, 'ERA5_wind_speed')] = unmoved_st['ERA5_wind_speed']
+        yearly_series[(station, 'ERA5-DMI_wind_speed')] = unmoved_st['ERA5_wind_speed'] - unmoved_st['DMI_wind_speed']
+trends = trend_table(yearly_series)
+
 for station in st_ID:
-    glob_string = 'DMI_ERA5_' + station + '_yearly.parq.gzip'                  #Create a dynamic string for input to search for station specific parquet-files
-    station_zip = glob.glob(glob_string)                                        #Find station specific parquet-files in current directory
+    station_zip = station_frames('DMI_ERA5_yearly', station)                    #Read station specific data from the dataset (empty if not stored)
     station_name = st_name[st_name_nr]                                          #Fetch station name
     st_name_nr = st_name_nr + 1                                                 #Counter for station names
     #print(station_name)
-    for i in station_zip:
-        if i == 'DMI_ERA5_06116_yearly.parq.gzip':                             #jump over itteration for station 06116
+    for station_df in station_zip:
+        if station == '06116':                                                  #jump over itteration for station 06116
            continue
            #Needed for run for NEW location since station has no values for new location yet
 
-        station_parq_yearly = pd.read_parquet(i)                               #Read and print parquet-file
-        #station_parq_monthly = pd.read_parquet('DMI_ERA5_06116_yearly.parq.gzip')
+        station_parq_yearly = station_df                                       #Station specific dataframe
+        #station_parq_monthly = station_frames('DMI_ERA5_yearly', '06116')[0]
 
         ## Plot and regression for timeframe of unchanged station location:        
-        counter = 0                                                             #create counter for number of rows containing original location
-        for row in range(len(station_parq_yearly)):
-            if station_parq_yearly.DMI_Lon[row] == station_parq_yearly.DMI_Lon[0] and station_parq_yearly.DMI_Lat[row] == station_parq_yearly.DMI_Lat[0]:
-                counter = counter + 1
-                #If longitude or latitude match the original location, increase row counter
-            else:
-                pass
-
-        # Drop all rows in dataframe with data for original or last location 
-        unmoved_st = station_parq_yearly.drop(station_parq_yearly.index[:counter+1])          #drop rows with old location
-        #unmoved_st = station_parq_yearly.drop(station_parq_yearly.index[counter:])            #drop rows with new location
-            #NOTE: one month excluded from both due to potential transition values.
+        unmoved_st = location_period(station_parq_yearly, yearly_period)       #rows from before or after the station was moved
         
         if len(unmoved_st) == 0:                        #jump over itteration if new dataframe is empty
             continue
@@ -378,15 +357,14 @@ for station in st_ID:
         # Create trendlines:
         x1 = mdates.date2num(unmoved_st.index)                            #convert timeindex to numbers and define x-coordinate
         y1= unmoved_st['DMI_wind_speed']                                  #define y-coordinate
-        mask = y1.isna()                                                            #create mask for y-coordinate to avoid trendline disappearing for missing data
-        z1 = np.polyfit(x1[~mask], y1[~mask], 1)                                    #create least squares linear fit to coordinates
+        z1 = trends.loc[(station, y1.name), ['slope', 'intercept']].to_numpy()        #slope and intercept from the trends of all stations
         slope_DMI = np.round(z1[0],6)                                               #calculate the slope of the trendline and round it
         p1 = np.poly1d(z1)                                                          #create linear object
         ax.plot(x1, p1(x1), color='darkslateblue', linestyle='--', linewidth=2)     #plot trendline
 
         x2 = mdates.date2num(unmoved_st.index)
         y2= unmoved_st['ERA5_wind_speed']
-        z2 = np.polyfit(x2, y2, 1)
+        z2 = trends.loc[(station, y2.name), ['slope', 'intercept']].to_numpy()
         slope_ERA5 = np.round(z2[0],6)                                               #calculate the slope of the trendline and round it
         p2 = np.poly1d(z2)
         ax.plot(x2, p2(x2), color='crimson', linestyle='--', linewidth=2)
@@ -401,10 +379,8 @@ for station in st_ID:
 
 
         ## Regression analysis: 
-        # x = sm.add_constant(x1)
-        # results = sm.OLS(y1,x, missing = 'drop').fit()
         # print('Regression analysis for DMI wind speed station ' + station)
-        # results.summary()
+        # trends.loc[(station, y1.name)]
 
 
 
@@ -428,29 +404,23 @@ for station in st_ID:
         # Create trendlines:
         x1 = mdates.date2num(unmoved_st.index)                            #convert timeindex to numbers and define x-coordinate
         y1= unmoved_st['ERA5-DMI_wind_speed']                                  #define y-coordinate
-        mask = y1.isna()                                                            #create mask for y-coordinate to avoid trendline disappearing for missing data
-        z1 = np.polyfit(x1[~mask], y1[~mask], 1)                                    #create least squares linear fit to coordinates
+        z1 = trends.loc[(station, y1.name), ['slope', 'intercept']].to_numpy()        #slope and intercept from the trends of all stations
         slope = np.round(z1[0],6)                                               #calculate the slope of the trendline and round it
         p1 = np.poly1d(z1)                                                          #create linear object
         ax.plot(x1, p1(x1), color='rebeccapurple', linestyle='--', linewidth=2)     #plot trendline
 
-        ## Conduct regression analysis: 
-        x = sm.add_constant(x1)
-        results = sm.OLS(y1,x, missing = 'drop').fit()
 
         #Write the trendline slope in the upper left corner
         ax.text(0.02, 0.98, 'Trendline slope = ' + str(slope), color='rebeccapurple', style='italic',  horizontalalignment='left', verticalalignment='top', transform = ax.transAxes)
-        ax.text(0.02, 0.94, 'p-value = ' + str(np.round(results.f_pvalue,3)), color='rebeccapurple', style='italic',  horizontalalignment='left', verticalalignment='top', transform = ax.transAxes)
+        ax.text(0.02, 0.94, 'p-value = ' + str(np.round(trends.loc[(station, y1.name), 'p_value'],3)), color='rebeccapurple', style='italic',  horizontalalignment='left', verticalalignment='top', transform = ax.transAxes)
         plt.show()                                                                 #display plot
         #plt.savefig("yearly_ERA5-DMI_wind_speed_" + station + ".png", dpi=200)              #save plot as png
         #plt.close(None)
 
 
         ## Regression analysis: 
-        x = sm.add_constant(x1)
-        results = sm.OLS(y1,x, missing = 'drop').fit()
         #print('Regression analysis for ERA5-DMI wind speed station ' + station)
-        results.summary()
+        trends.loc[(station, y1.name)]                 #slope, intercept, standard error, p-value and R² of the trend
 
 
 
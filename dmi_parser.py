@@ -0,0 +1,94 @@
+##### DMI response parser #####
+
+## This module converts GeoJSON responses from DMIs metObs API into columnar Arrow tables without building the full dictionary
+## tree of the response. The "features" are read incrementally from the response stream and each value is written directly into
+## typed column buffers (time, value, longitude and latitude), which are emitted as Arrow record batches.
+## Only one feature at a time exists as Python objects.
+
+
+# Import packages:
+import array
+import numpy as np
+import ijson                        # For incremental (streaming) JSON parsing
+import pyarrow as pa                # For columnar tables and parquet-files
+
+
+## Schema of the parsed observations:
+    #Time is stored as microseconds since 1970 (UTC), station and parameter are dictionary encoded since they are constant per request.
+schema = pa.schema([('Time', pa.timestamp('us', tz='UTC')),
+                    ('Station_ID', pa.dictionary(pa.int32(), pa.string())),
+                    ('Parameter', pa.dictionary(pa.int32(), pa.string())),
+                    ('value', pa.float32()),
+                    ('Longitude', pa.float64()),
+                    ('Latitude', pa.float64())])
+
+
+## Column buffers for one record batch:
+class ColumnBuffers:
+    def __init__(self):
+        self.time = []                                              #observed time strings, converted to int64 when the batch is emitted
+        self.station = array.array('i')                             #index into station_names
+        self.parameter = array.array('i')                           #index into parameter_names
+        self.value = array.array('f')
+        self.lon = array.array('d')
+        self.lat = array.array('d')
+        self.station_names = {}
+        self.parameter_names = {}
+
+    def __len__(self):
+        return len(self.time)
+
+    # Convert the buffers to an Arrow record batch:
+    def to_batch(self):
+        time = pa.array(self.time, pa.string()).cast(pa.timestamp('us', tz='UTC'))       #parse ISO time strings in one call
+        station = pa.DictionaryArray.from_arrays(np.frombuffer(self.station, dtype=np.int32), pa.array(list(self.station_names), pa.string()))
+        parameter = pa.DictionaryArray.from_arrays(np.frombuffer(self.parameter, dtype=np.int32), pa.array(list(self.parameter_names), pa.string()))
+        value = pa.array(np.frombuffer(self.value, dtype=np.float32))
+        lon = pa.array(np.frombuffer(self.lon, dtype=np.float64))
+        lat = pa.array(np.frombuffer(self.lat, dtype=np.float64))
+        return pa.RecordBatch.from_arrays([time, station, parameter, value, lon, lat], schema=schema)
+
+
+## Parse the features of a response stream and yield record batches of at most batch_size observations:
+    #ijson builds one small dictionary per feature in C which is discarded as soon as its values are in the buffers, so memory use
+    #does not grow with the size of the response. Missing values and coordinates are stored as NaN. Features without an observed 
+    #time are skipped.
+    #This loop runs once per observation, so the buffer methods are looked up once per batch rather than once per row.
+def parse_features(stream, batch_size=65536):
+    nan = np.nan
+    no_coordinates = (nan, nan)
+    n = 0
+
+    for feature in ijson.items(stream, 'features.item', use_float=True):
+        if n == 0:                                                  #start a new batch
+            buffers = ColumnBuffers()
+            add_time, add_value, add_lon, add_lat = buffers.time.append, buffers.value.append, buffers.lon.append, buffers.lat.append
+            add_station, add_parameter = buffers.station.append, buffers.parameter.append
+            station_names, parameter_names = buffers.station_names, buffers.parameter_names
+
+        properties = feature.get('properties') or {}
+        observed = properties.get('observed')
+        if observed is None:
+            continue
+        value = properties.get('value')
+        coordinates = (feature.get('geometry') or {}).get('coordinates') or no_coordinates
+        lon, lat = (coordinates[0], coordinates[1]) if len(coordinates) > 1 else no_coordinates
+
+        add_time(observed)
+        add_value(nan if value is None else value)
+        add_lon(nan if lon is None else lon)
+        add_lat(nan if lat is None else lat)
+        add_station(station_names.setdefault(properties.get('stationId'), len(station_names)))
+        add_parameter(parameter_names.setdefault(properties.get('parameterId'), len(parameter_names)))
+        n = n + 1
+        if n >= batch_size:
+            yield buffers.to_batch()
+            n = 0
+
+    if n > 0:
+        yield buffers.to_batch()
+
+
+## Parse a whole response stream into one Arrow table (an empty table if there are no features):
+def read_response(stream, batch_size=65536):
+    return pa.Table.from_batches(list(parse_features(stream, batch_size)), schema=schema)
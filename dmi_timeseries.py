@@ -0,0 +1,277 @@
+##### DMI time series tools #####
+
+## This module holds the processing steps for DMI station time series that are shared between the scripts.
+## The DMI observations are aligned to a regular time grid (10 min) where missing observations are inserted as NaNs.
+## The station location is stored separately as a run-length table with one row per position of the station.
+## Aligned series can be joined to the times of another dataset (e.g. the hourly ERA5 data) by nearest observation or window mean.
+## Daily, monthly, seasonal and yearly means are computed together with the number of valid samples behind each mean.
+## Statistics can be binned by wind direction sector and speed class for each period (wind-rose cube).
+
+
+# Import packages:
+import pandas as pd
+import numpy as np
+
+
+### Align observations to a regular time grid:
+
+## Move observations to the grid time they belong to:
+    #Without tolerance observations are kept as they are (only exact grid times will match). With a tolerance each observation is moved
+    #to the nearest grid time if it is closer than the tolerance, and for each grid time only the closest observation is kept.
+def snap_to_grid(df, freq='10T', tolerance=None):
+    if tolerance is None:
+        return df.drop_duplicates('Time')
+    snapped = df.Time.dt.round(freq)
+    offset = (df.Time - snapped).abs()
+    df = df.assign(Time=snapped, offset=offset)[offset <= pd.Timedelta(tolerance)]
+    return df.sort_values('offset', kind='stable').drop_duplicates('Time').drop(columns='offset')
+
+
+## Align wind speed and wind direction for one station to a regular time grid in one step:
+    #Both inputs are dataframes with a "Time" column, wind_speed_df with a "wind_speed" column and wind_dir_df with "wind_dir",
+    #"Longitude" and "Latitude" columns (the station location is taken from the wind direction observations).
+    #The two parameters are joined on time and then reindexed onto the grid from start to end (end=None: the last observation).
+    #Without tolerance only observations exactly on the grid are used. With a tolerance (e.g. '2min') observations off the grid are
+    #matched to the nearest grid time within the tolerance (see "snap_to_grid").
+    #Returns the aligned dataframe (UTC time index, float32 wind columns), the run-length location table (see "location_runs") and a
+    #Series with the number of NaNs per column.
+def align_to_grid(wind_speed_df, wind_dir_df, start, end=None, freq='10T', tolerance=None):
+    speed = snap_to_grid(wind_speed_df[['Time', 'wind_speed']], freq, tolerance).set_index('Time')
+    direction = snap_to_grid(wind_dir_df[['Time', 'wind_dir', 'Longitude', 'Latitude']], freq, tolerance).set_index('Time')
+    obs = speed.join(direction, how='outer').sort_index()                  #join both parameters on time
+
+    if end is None:
+        end = obs.index.max().floor(freq) if len(obs) > 0 else start
+    grid = pd.date_range(start=start, end=end, freq=freq, name='Time')     #create date range over the timeperiod
+    if grid.tz is None:
+        grid = grid.tz_localize('UTC')
+    obs.index = obs.index.astype(grid.dtype)                               #same time unit as the grid
+
+    aligned = obs.reindex(grid)                                             #NaN where the grid has no observation
+    nan_count = aligned[['wind_speed', 'wind_dir', 'Longitude']].isna().sum()
+    nan_count.index = ['Wind speed', 'Wind direction', 'Longitude, Latitude']
+
+    ## Create new dataframe with the columns of the stored station files:
+    new_df = pd.DataFrame({'Wind speed': aligned.wind_speed.to_numpy(np.float32),
+                           'Wind direction': aligned.wind_dir.to_numpy(np.float32)}, index=grid)
+    location_df = location_runs(aligned.index, aligned.Longitude.to_numpy(), aligned.Latitude.to_numpy())
+    return new_df, location_df, nan_count
+
+
+
+### Aggregation to daily, monthly, seasonal and yearly means:
+
+## Periods of the rollups (pandas resample rules, labelled by the last day of the period like "resample('M')"):
+    #Seasons are DJF, MAM, JJA and SON, so December belongs to the winter of the following year.
+rollup_rules = {'monthly': 'M', 'seasonal': 'Q-NOV', 'yearly': 'Y'}
+
+
+## Daily sums and numbers of valid samples of each column (the only pass over the full series):
+    #Directions (in degrees, given in "directions" as {direction column: speed column}) are summed as u- and v-components, so they
+    #are averaged through u/v. With speed column None the directions are averaged as unit vectors (e.g. angles between two winds).
+    #"Expected_count" is the number of samples a complete day has at the sampling frequency "freq".
+def daily_sums(df, freq='10T', directions={}):
+    index = pd.DatetimeIndex(df.index)
+    first_day = pd.Timestamp(year=index[0].year - 1, month=12, day=1, tz=index.tz)       #from the winter before the first year
+    last_day = pd.Timestamp(year=index[-1].year, month=12, day=31, tz=index.tz)          #to the end of the last year
+        #Whole years (and seasons) are covered, so the expected number of samples of a coarser period is always complete.
+    day = ((index - first_day) // pd.Timedelta('1D')).to_numpy(np.int64)  #day number of each sample (any index resolution)
+    ndays = (last_day - first_day).days + 1
+
+    sums = {}
+    for column in df.columns:
+        values = df[column].to_numpy(np.float64)
+        if column in directions:
+            speed = df[directions[column]].to_numpy(np.float64) if directions[column] is not None else np.ones(len(values))
+            valid = ~(np.isnan(values) | np.isnan(speed))
+            radians = np.radians(values[valid])
+            sums[column + '_u'] = np.bincount(day[valid], -speed[valid]*np.sin(radians), minlength=ndays)
+            sums[column + '_v'] = np.bincount(day[valid], -speed[valid]*np.cos(radians), minlength=ndays)
+        else:
+            valid = ~np.isnan(values)
+            sums[column + '_sum'] = np.bincount(day[valid], values[valid], minlength=ndays)
+        sums[column + '_count'] = np.bincount(day[valid], minlength=ndays)
+    sums['Expected_count'] = np.full(ndays, pd.Timedelta('1D') // pd.Timedelta(freq))
+    return pd.DataFrame(sums, index=pd.date_range(first_day, periods=ndays, freq='D', name=index.name))
+
+
+## Means and numbers of valid samples from sums:
+    #Means of periods where less than "min_coverage" of the expected samples are valid are set to NaN, except for the columns in
+    #"location_columns" (e.g. the station longitude and latitude), which are kept for every period with at least one sample.
+def means_from_sums(sums, columns, directions={}, min_coverage=0.0, location_columns=()):
+    means = {}
+    enough = lambda column: (column in location_columns
+                             or sums[column + '_count'].to_numpy() >= min_coverage * sums['Expected_count'].to_numpy())
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for column in columns:
+            count = sums[column + '_count'].to_numpy()
+            if column in directions:
+                u, v = sums[column + '_u'].to_numpy(), sums[column + '_v'].to_numpy()
+                mean = np.degrees(np.arctan2(-u, -v)) % 360                 #direction the mean wind is blowing from
+            else:
+                mean = sums[column + '_sum'].to_numpy() / count
+            means[column] = np.where((count > 0) & enough(column), mean, np.nan).astype(np.float32)
+    df = pd.DataFrame(means, index=sums.index)
+    for column in columns:
+        df[column + '_count'] = sums[column + '_count'].to_numpy()
+    df['Expected_count'] = sums['Expected_count'].to_numpy()
+    return df
+
+
+## Daily, monthly, seasonal and yearly means of a series (UTC time index, sampled at "freq") in one pass:
+    #The daily sums are computed from the series, each coarser rollup is summed from the finer one (monthly from daily, seasonal and
+    #yearly from monthly). Every rollup has the number of valid samples of each column ("<column>_count") and of a complete period
+    #("Expected_count"), and means below the minimum coverage are NaN, except for the location columns (see "means_from_sums").
+    #Returns a dictionary with the dataframes 'daily', 'monthly', 'seasonal' and 'yearly'.
+    #Only the periods from the one holding the first sample to the one holding the last sample are returned.
+def rollups(df, freq='10T', directions={}, min_coverage=0.0, location_columns=()):
+    daily = daily_sums(df, freq, directions)
+    monthly = daily.resample(rollup_rules['monthly']).sum()
+    sums = {'daily': daily, 'monthly': monthly,
+            'seasonal': monthly.resample(rollup_rules['seasonal']).sum(),
+            'yearly': monthly.resample(rollup_rules['yearly']).sum()}
+
+    first_day, last_day = df.index[0].floor('D'), df.index[-1].floor('D')
+    means = {}
+    for period in sums:
+        labels = sums[period].index                                         #last day of each period
+        periods = slice(labels.searchsorted(first_day), labels.searchsorted(last_day) + 1)
+        means[period] = means_from_sums(sums[period].iloc[periods], df.columns, directions, min_coverage, location_columns)
+    return means
+
+
+
+### Statistics by wind direction sector and speed class (wind-rose cube):
+
+## Mean values for each period, direction sector and speed class in one vectorized pass over a series:
+    #Each sample is put in a sector of the direction column (sector 0 is centred on north, sectors of 360/sectors degrees going clockwise)
+    #and a class of the speed column (class i holds speeds from speed_bins[i] up to speed_bins[i+1], the last class has no upper
+    #limit), and all cells of the cube (period, sector, speed class) are summed at once with np.bincount.
+    #"values" are averaged arithmetically and "angles" (in degrees, e.g. alpha) as unit vectors, both skipping NaN for each column.
+    #Period is one of rollup_rules ('monthly', 'seasonal' or 'yearly'), labelled by the last day of the period.
+    #Returns a dataframe with one row per cell (time index, "Sector", "Sector_center", "Speed_class", "Speed_min", "Count" and for
+    #each value and angle column its mean and "<column>_count"), including empty cells.
+def sector_cube(df, direction, speed, values=(), angles=(), sectors=12, speed_bins=(0, 2, 4, 6, 8, 10, 15), period='yearly'):
+    width = 360 / sectors
+    direction_values = df[direction].to_numpy(np.float64)
+    speed_values = df[speed].to_numpy(np.float64)
+    valid = ~(np.isnan(direction_values) | np.isnan(speed_values))
+    df, direction_values, speed_values = df[valid], direction_values[valid], speed_values[valid]
+
+    index = pd.DatetimeIndex(df.index)
+    periods = (index.tz_convert('UTC').tz_localize(None) if index.tz is not None else index).to_period(rollup_rules[period])
+    period_code, period_labels = pd.factorize(periods, sort=True)
+    nsectors, nclasses = sectors, len(speed_bins)
+    sector = (np.floor(((direction_values + width/2) % 360) / width).astype(np.int64)) % nsectors
+    speed_class = np.clip(np.searchsorted(speed_bins, speed_values, side='right') - 1, 0, nclasses - 1)
+    cell = (period_code * nsectors + sector) * nclasses + speed_class        #cell of the cube for each sample
+    ncells = len(period_labels) * nsectors * nclasses
+
+    cube = {'Sector': np.tile(np.repeat(np.arange(nsectors), nclasses), len(period_labels)),
+            'Sector_center': np.tile(np.repeat(np.arange(nsectors) * width, nclasses), len(period_labels)).astype(np.float32),
+            'Speed_class': np.tile(np.arange(nclasses), len(period_labels) * nsectors),
+            'Speed_min': np.tile(np.asarray(speed_bins, dtype=np.float32), len(period_labels) * nsectors),
+            'Count': np.bincount(cell, minlength=ncells)}
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for column in list(values) + list(angles):
+            x = df[column].to_numpy(np.float64)
+            ok = ~np.isnan(x)
+            count = np.bincount(cell[ok], minlength=ncells)
+            if column in angles:
+                radians = np.radians(x[ok])
+                mean = np.degrees(np.arctan2(np.bincount(cell[ok], np.sin(radians), minlength=ncells),
+                                             np.bincount(cell[ok], np.cos(radians), minlength=ncells)))
+            else:
+                mean = np.bincount(cell[ok], x[ok], minlength=ncells) / count
+            cube[column] = np.where(count > 0, mean, np.nan).astype(np.float32)
+            cube[column + '_count'] = count
+
+    time = period_labels.to_timestamp(how='end').floor('D').tz_localize('UTC')
+    return pd.DataFrame(cube, index=pd.DatetimeIndex(np.repeat(time, nsectors * nclasses), name='Time'))
+
+
+
+### Align to the times of another dataset (e.g. hourly ERA5):
+
+## Align the columns of a time series to given times with a sorted-key join on int64 timestamps:
+    #Both the series (UTC time index) and the times must be sorted. Missing values (NaN) are skipped for each column.
+    #rule='nearest': the observation closest to each time, if it is within the tolerance (e.g. '10min').
+    #rule='mean': the mean of the observations in the window centred on each time (e.g. '1H': from 30 min before to 30 min after,
+    #the end excluded). Directions (in degrees, given in "direction_columns") are averaged as unit vectors.
+    #Returns a dataframe indexed by the times with float32 columns, NaN where no observation matches.
+def align_to_times(df, times, rule='nearest', tolerance='10min', window='1H', direction_columns=()):
+    times = pd.DatetimeIndex(times)
+    keys = (times.tz_convert('UTC') if times.tz is not None else times.tz_localize('UTC')).as_unit('ns').asi8
+    index = pd.DatetimeIndex(df.index)
+    obs_keys_all = (index.tz_convert('UTC') if index.tz is not None else index.tz_localize('UTC')).as_unit('ns').asi8
+        #keys in nanoseconds whatever the resolution of the indexes, like the tolerance and window below
+
+    aligned = {}
+    for column in df.columns:
+        values = df[column].to_numpy(np.float64)
+        valid = ~np.isnan(values)
+        obs_keys, values = obs_keys_all[valid], values[valid]
+        if len(values) == 0:
+            aligned[column] = np.full(len(keys), np.nan, dtype=np.float32)
+            continue
+
+        if rule == 'nearest':
+            right = np.clip(np.searchsorted(obs_keys, keys), 0, len(obs_keys) - 1)     #first observation at or after each time
+            left = np.clip(right - 1, 0, len(obs_keys) - 1)
+            nearest = np.where(np.abs(obs_keys[left] - keys) <= np.abs(obs_keys[right] - keys), left, right)
+            matched = np.abs(obs_keys[nearest] - keys) <= pd.Timedelta(tolerance).value
+            aligned[column] = np.where(matched, values[nearest], np.nan).astype(np.float32)
+
+        elif rule == 'mean':
+            half = pd.Timedelta(window).value // 2
+            first = np.searchsorted(obs_keys, keys - half, side='left')                 #observations in [time - half, time + half)
+            last = np.searchsorted(obs_keys, keys + half, side='left')
+            count = last - first
+            def window_sum(x):
+                cumulative = np.concatenate([[0.], np.cumsum(x)])
+                return cumulative[last] - cumulative[first]
+            with np.errstate(invalid='ignore', divide='ignore'):
+                if column in direction_columns:
+                    radians = np.radians(values)
+                    mean = np.degrees(np.arctan2(window_sum(np.sin(radians)), window_sum(np.cos(radians)))) % 360
+                else:
+                    mean = window_sum(values) / count
+            aligned[column] = np.where(count > 0, mean, np.nan).astype(np.float32)
+
+        else:
+            raise ValueError("rule must be 'nearest' or 'mean', not " + repr(rule))
+    return pd.DataFrame(aligned, index=times)
+
+
+
+### Station locations:
+
+## Compress the location of a station into one row per position (run-length table):
+    #Each row holds the position and the time it was first ("Start") and last ("End") observed there. Missing locations (NaN) belong
+    #to the previous position, or to the first one if the series starts with missing locations.
+def location_runs(time, lon, lat):
+    time = pd.DatetimeIndex(time)
+    valid = ~(np.isnan(lon) | np.isnan(lat))
+    lon, lat, valid_time = lon[valid], lat[valid], time[valid]
+    if len(lon) == 0:
+        return pd.DataFrame({'Start': pd.DatetimeIndex([], tz='UTC'), 'End': pd.DatetimeIndex([], tz='UTC'),
+                             'Longitude': np.array([], np.float32), 'Latitude': np.array([], np.float32)})
+    change = np.flatnonzero((lon[1:] != lon[:-1]) | (lat[1:] != lat[:-1])) + 1    #first observation at a new position
+    first = np.concatenate([[0], change])
+    last = np.concatenate([change - 1, [len(lon) - 1]])
+    return pd.DataFrame({'Start': valid_time[first], 'End': valid_time[last],
+                         'Longitude': lon[first].astype(np.float32), 'Latitude': lat[first].astype(np.float32)})
+
+
+## Look up the row of a run-length table that holds the station location at the given times:
+    #Times before the first run get the first position, times between two runs the earlier one.
+def runs_at(location_df, time):
+    run = pd.DatetimeIndex(location_df.Start).searchsorted(pd.DatetimeIndex(time), side='right') - 1
+    return np.clip(run, 0, len(location_df) - 1)
+
+
+## Look up the station location at the given times from a run-length table:
+    #Returns longitude and latitude arrays.
+def locations_at(location_df, time):
+    run = runs_at(location_df, time)
+    return location_df.Longitude.to_numpy()[run], location_df.Latitude.to_numpy()[run]
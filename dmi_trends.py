@@ -0,0 +1,85 @@
+##### DMI trends #####
+
+## This module calculates the linear trends used by the statistics and plotting scripts for all stations and variables at once.
+## The series (e.g. monthly DMI wind speed, ERA5 wind speed, ERA5-DMI and alpha for every station) are stacked into one matrix on a
+## common time axis, with NaN for missing values, and the least squares line of every row is calculated in closed form with
+## vectorized sums. This gives the same slope, intercept and p-value as np.polyfit and statsmodels OLS for each series separately.
+## Time is counted in days as in matplotlib.dates.date2num, so slopes are per day and trendlines can be drawn against date2num.
+
+
+# Import packages:
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+
+## Time in days since 1970-01-01 (the same numbers as matplotlib.dates.date2num):
+def trend_x(index):
+    index = pd.DatetimeIndex(index)
+    if index.tz is not None:
+        index = index.tz_convert('UTC').tz_localize(None)
+    return ((index - pd.Timestamp('1970-01-01')) / pd.Timedelta('1D')).to_numpy(np.float64)
+
+
+## Stack series with a time index into a matrix (series, time) on the union of their times:
+    #Returns the keys of the series in row order, the time in days (see "trend_x") and the matrix with NaN where a series has no value.
+def stack_series(series):
+    keys = list(series)
+    times = pd.DatetimeIndex([]) if len(keys) == 0 else pd.DatetimeIndex(series[keys[0]].index)
+    for key in keys[1:]:
+        times = times.union(pd.DatetimeIndex(series[key].index))
+    Y = np.full((len(keys), len(times)), np.nan)
+    for row, key in enumerate(keys):
+        Y[row, times.get_indexer(series[key].index)] = series[key].to_numpy(np.float64)
+    return keys, trend_x(times), Y
+
+
+## Least squares line y = slope*x + intercept for every row of a matrix at once:
+    #NaN values are left out of the fit of their row. The standard error and p-value (two-sided t-test of the slope, the same as the
+    #F-test of statsmodels OLS with one regressor) need at least 3 values.
+    #Returns a dataframe with one row per series: number of values, slope, intercept, standard error of the slope, t-value, p-value
+    #and R².
+def linear_trends(x, Y):
+    Y = np.atleast_2d(np.asarray(Y, dtype=np.float64))
+    X = np.broadcast_to(np.asarray(x, dtype=np.float64), Y.shape)
+    mask = ~(np.isnan(Y) | np.isnan(X))
+    n = mask.sum(axis=1)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        x_mean = np.where(mask, X, 0).sum(axis=1) / n
+        y_mean = np.where(mask, Y, 0).sum(axis=1) / n
+        dx = np.where(mask, X - x_mean[:, np.newaxis], 0)              #deviations from the mean of each row (0 where missing)
+        dy = np.where(mask, Y - y_mean[:, np.newaxis], 0)
+        sxx = np.einsum('ij,ij->i', dx, dx)
+        sxy = np.einsum('ij,ij->i', dx, dy)
+        syy = np.einsum('ij,ij->i', dy, dy)
+
+        slope = sxy / sxx
+        intercept = y_mean - slope * x_mean
+        dof = n - 2
+        ssr = np.maximum(syy - slope * sxy, 0)                          #sum of squared residuals
+        stderr = np.where(dof > 0, np.sqrt(ssr / np.maximum(dof, 1) / sxx), np.nan)
+        t_value = slope / stderr
+        p_value = np.where(dof > 0, 2 * stats.t.sf(np.abs(t_value), np.maximum(dof, 1)), np.nan)
+        r_squared = 1 - ssr / syy
+
+    return pd.DataFrame({'n': n, 'slope': slope, 'intercept': intercept, 'stderr': stderr, 't_value': t_value,
+                         'p_value': p_value, 'r_squared': r_squared})
+
+
+## Trends of many series given as {(station, variable): series with a time index} in one calculation:
+    #Returns a table indexed by (Station_ID, Variable), see "linear_trends".
+def trend_table(series):
+    keys, x, Y = stack_series(series)
+    table = linear_trends(x, Y)
+    table.index = pd.MultiIndex.from_tuples(keys, names=['Station_ID', 'Variable'])
+    return table
+
+
+## Rows of a station table from before or after the station was moved:
+    #Rows at the first location (DMI_Lon, DMI_Lat) are counted. 'before' keeps that many rows from the start, 'after' drops them and
+    #one more row, since the month of the move can hold values from both locations.
+def location_period(df, period='before'):
+    same = (df.DMI_Lon == df.DMI_Lon.iloc[0]) & (df.DMI_Lat == df.DMI_Lat.iloc[0])
+    counter = int(same.sum())
+    return df.iloc[:counter] if period == 'before' else df.iloc[counter+1:]
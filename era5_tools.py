@@ -0,0 +1,215 @@
+##### ERA5 tools #####
+
+## This module holds the reading of ERA5 netCDF-files that is shared between the scripts.
+## A bounding box and a time range are turned into index ranges (hyperslabs) on the netCDF-variables, so only the needed block of
+## latitudes, longitudes and timesteps is read from disk instead of the full downloaded domain.
+## Bounding boxes are given as (lon_min, lon_max, lat_min, lat_max), the same order as the map extents, e.g. (6.9, 15.4, 54, 58).
+## Station positions are mapped to their nearest gridpoint with a KD-tree over the grid, using great-circle (haversine) distances.
+
+
+# Import packages:
+import numpy as np
+import pandas as pd
+import netCDF4 as nc
+import xarray as xr
+from scipy.spatial import cKDTree           # Spatial index over the gridpoints
+
+
+## Set constants:
+rad_earth_km = 6371                         # mean radius of the Earth, unit: km
+level_names = ('level', 'pressure_level')   # names of the pressure level dimension (our own files use "level")
+
+
+## Names of the latitude, longitude and time coordinates of a dataset (ERA5 downloads use "latitude", our own files use "lat"):
+def coordinate_names(variables):
+    lat_name = 'lat' if 'lat' in variables else 'latitude'
+    lon_name = 'lon' if 'lon' in variables else 'longitude'
+    time_name = 'time' if 'time' in variables else 'valid_time'
+    return lat_name, lon_name, time_name
+
+
+
+### Index ranges:
+
+## Latitude and longitude index ranges covering a bounding box:
+    #"pad" adds gridpoints on each side (e.g. pad=1 for calculations with centred differences). bbox=None gives the full grid.
+def bbox_slices(lat, lon, bbox=None, pad=0):
+    if bbox is None:
+        return slice(0, len(lat)), slice(0, len(lon))
+    lon_min, lon_max, lat_min, lat_max = bbox
+    lat_index = np.flatnonzero((np.asarray(lat) >= lat_min) & (np.asarray(lat) <= lat_max))
+    lon_index = np.flatnonzero((np.asarray(lon) >= lon_min) & (np.asarray(lon) <= lon_max))
+    if len(lat_index) == 0 or len(lon_index) == 0:
+        raise ValueError('No gridpoints inside the bounding box ' + str(bbox))
+    lat_slice = slice(max(lat_index[0] - pad, 0), min(lat_index[-1] + 1 + pad, len(lat)))
+    lon_slice = slice(max(lon_index[0] - pad, 0), min(lon_index[-1] + 1 + pad, len(lon)))
+    return lat_slice, lon_slice
+
+
+## Time as a timestamp without time zone (ERA5 times are UTC):
+def naive_utc(time):
+    time = pd.Timestamp(time)
+    return time.tz_convert('UTC').tz_localize(None) if time.tz is not None else time
+
+
+## Index range of sorted times covering a time range (start, end), both inclusive:
+    #Times may be strings or timestamps, None for an open end. "to_time" converts a timestamp to the type of "times".
+def range_slice(times, time_range, to_time):
+    start, end = time_range
+    first = int(np.searchsorted(times, to_time(naive_utc(start)), side='left')) if start is not None else 0
+    last = int(np.searchsorted(times, to_time(naive_utc(end)), side='right')) if end is not None else len(times)
+    return slice(first, last)
+
+
+## Time index range of a netCDF time variable covering a time range (start, end), both inclusive:
+    #time_range=None gives all timesteps.
+def time_slice(time_var, time_range=None):
+    if time_range is None:
+        return slice(0, len(time_var))
+    calendar = getattr(time_var, 'calendar', 'standard')
+    return range_slice(time_var[:], time_range, lambda time: nc.date2num(time.to_pydatetime(), time_var.units, calendar))
+
+
+
+### Reading:
+
+## Index of a pressure level (e.g. 1000 hPa) in the level dimension of a netCDF-variable:
+    #Returns None if the variable has no level dimension (the level is then ignored). level=None is only allowed for a single level.
+def level_position(dataset, name, level=None):
+    level_dim = [dim for dim in dataset.variables[name].dimensions if dim in level_names]
+    if len(level_dim) == 0:
+        return None
+    levels = np.asarray(dataset.variables[level_dim[0]][:])
+    if level is None and len(levels) == 1:
+        return 0
+    matches = np.flatnonzero(levels == level)
+    if len(matches) == 0:
+        raise ValueError(name + ' has the pressure levels ' + str(levels.tolist()) + ', choose one of them with level=..., not '
+                         + repr(level))
+    return int(matches[0])
+
+
+## A netCDF-variable (time, [level,] lat, lon) restricted to a hyperslab:
+    #Behaves like the variable for len() and slicing in time, and reads only the selected block from disk.
+    #With a level index only that level is read and the variable is (time, lat, lon).
+class Hyperslab:
+    def __init__(self, variable, time_index, lat_index, lon_index, level_index=None):
+        self.variable = variable
+        self.time_index = time_index
+        self.lat_index = lat_index
+        self.lon_index = lon_index
+        self.level_index = level_index
+        self.dimensions = variable.dimensions
+        ntime = len(range(*time_index.indices(variable.shape[0])))
+        nlat = len(range(*lat_index.indices(variable.shape[-2])))
+        nlon = len(range(*lon_index.indices(variable.shape[-1])))
+        self.shape = (ntime,) + tuple(variable.shape[1:-2]) + (nlat, nlon)
+        if level_index is not None:
+            self.dimensions = tuple(dim for dim in variable.dimensions if dim not in level_names)
+            self.shape = (ntime, nlat, nlon)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, key):
+        start, stop, _ = key.indices(len(self)) if isinstance(key, slice) else (key, key + 1, 1)
+        t0 = self.time_index.start
+        level = (Ellipsis,) if self.level_index is None else (self.level_index,)
+        return self.variable[(slice(t0 + start, t0 + stop),) + level + (self.lat_index, self.lon_index)]
+
+
+## Open a variable of a netCDF-dataset restricted to a bounding box and time range:
+    #Variables with pressure levels are restricted to the given level (e.g. 1000 hPa), level='all' keeps all levels.
+    #Returns the variable as a Hyperslab together with the selected latitudes, longitudes and time values.
+def open_subset(dataset, name, bbox=None, time_range=None, pad=0, level=None):
+    lat_name, lon_name, time_name = coordinate_names(dataset.variables)
+    lat = dataset.variables[lat_name][:]
+    lon = dataset.variables[lon_name][:]
+    lat_index, lon_index = bbox_slices(lat, lon, bbox, pad)
+    time_index = time_slice(dataset.variables[time_name], time_range)
+    level_index = None if level == 'all' else level_position(dataset, name, level)
+    variable = Hyperslab(dataset.variables[name], time_index, lat_index, lon_index, level_index)
+    return variable, lat[lat_index], lon[lon_index], dataset.variables[time_name][time_index]
+
+
+## Read a variable of a netCDF-file restricted to a bounding box, time range and pressure level into an array:
+def read_subset(filename, name, bbox=None, time_range=None, level=None):
+    with nc.Dataset(filename, 'r') as dataset:
+        variable = open_subset(dataset, name, bbox, time_range, level=level)[0]
+        return np.asarray(variable[:])
+
+
+## Open a netCDF-file with xarray restricted to a bounding box, time range and pressure level:
+    #The dataset is opened lazily, so only the selected block is read when the data is used.
+    #A file with pressure levels is restricted to the given level (level=None only for a single level), so the variables are
+    #(time, lat, lon) as in a file without levels.
+def open_xr_subset(filename, bbox=None, time_range=None, level=None):
+    ds = xr.open_dataset(filename)
+    lat_name, lon_name, time_name = coordinate_names(ds.variables)
+    lat_index, lon_index = bbox_slices(ds[lat_name].values, ds[lon_name].values, bbox)
+    ds = ds.isel({lat_name: lat_index, lon_name: lon_index})
+    level_dim = [dim for dim in ds.dims if dim in level_names]
+    if len(level_dim) > 0:
+        levels = ds[level_dim[0]].values
+        if level is None and len(levels) != 1:
+            raise ValueError(filename + ' has the pressure levels ' + str(levels.tolist()) + ', choose one of them with level=...')
+        ds = ds.isel({level_dim[0]: 0}) if level is None else ds.sel({level_dim[0]: level})
+    if time_range is not None:
+        ds = ds.isel({time_name: range_slice(ds[time_name].values, time_range, np.datetime64)})
+    return ds
+
+
+
+### Station points:
+
+## Points on the unit sphere (x, y, z) for latitudes and longitudes in degrees:
+    #The straight-line distance between two such points increases with their great-circle distance, so the nearest neighbour in
+    #(x, y, z) is the nearest point by haversine distance.
+def unit_vectors(lat, lon):
+    lat = np.radians(np.asarray(lat, dtype=np.float64))
+    lon = np.radians(np.asarray(lon, dtype=np.float64))
+    return np.stack([np.cos(lat)*np.cos(lon), np.cos(lat)*np.sin(lon), np.sin(lat)], axis=-1)
+
+
+## Nearest gridpoint of each point (latitudes and longitudes in degrees) with one query of a KD-tree over the grid:
+    #Returns the latitude and longitude index of the gridpoint and the great-circle distance to it in km.
+def nearest_gridpoints(lat, lon, lat_points, lon_points):
+    grid_lat, grid_lon = np.meshgrid(np.asarray(lat), np.asarray(lon), indexing='ij')
+    tree = cKDTree(unit_vectors(grid_lat.ravel(), grid_lon.ravel()))
+    chord, index = tree.query(unit_vectors(np.atleast_1d(lat_points), np.atleast_1d(lon_points)))
+    distance = 2*np.arcsin(np.minimum(chord/2, 1))*rad_earth_km
+    ilat, ilon = np.divmod(index, len(lon))
+    return ilat, ilon, distance
+
+
+## Extract the time series at the nearest gridpoint of several points in one pass over a netCDF-file:
+    #The variables must be (time, lat, lon) or (time, level, lat, lon), in which case the series of the given pressure level are
+    #extracted (level=None only for a single level). The file is read in chunks of "chunk_size" timesteps, and of each chunk only
+    #the block of gridpoints spanned by the points is read. All points are then taken from the block with one vectorized index.
+    #Returns the times (UTC), the latitude and longitude of the gridpoint of each point and a dictionary with an array
+    #(time, point) for each variable.
+def extract_points(filename, lat_points, lon_points, variables, time_range=None, chunk_size=8760, level=None):
+    with nc.Dataset(filename, 'r') as dataset:
+        lat_name, lon_name, time_name = coordinate_names(dataset.variables)
+        lat = dataset.variables[lat_name][:]
+        lon = dataset.variables[lon_name][:]
+        ilat, ilon, _ = nearest_gridpoints(lat, lon, lat_points, lon_points)
+        lat_block = slice(ilat.min(), ilat.max() + 1)                   #block of gridpoints spanned by the points
+        lon_block = slice(ilon.min(), ilon.max() + 1)
+
+        time_var = dataset.variables[time_name]
+        time_index = time_slice(time_var, time_range)
+        time_values = time_var[time_index]
+        times = nc.num2date(time_values, time_var.units, getattr(time_var, 'calendar', 'standard'),
+                            only_use_cftime_datetimes=False, only_use_python_datetimes=True)
+        times = pd.DatetimeIndex(times).tz_localize('UTC')
+
+        series = {name: np.empty((len(times), len(ilat)), dtype=np.float32) for name in variables}
+        hyperslabs = {name: Hyperslab(dataset.variables[name], time_index, lat_block, lon_block, level_position(dataset, name, level))
+                      for name in variables}
+        for t0 in range(0, len(times), chunk_size):
+            t1 = min(t0 + chunk_size, len(times))
+            for name in variables:
+                block = hyperslabs[name][t0:t1]
+                series[name][t0:t1] = np.ma.filled(block[:, ilat - lat_block.start, ilon - lon_block.start], np.nan)
+    return times, lat[ilat], lon[ilon], series
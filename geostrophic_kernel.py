@@ -0,0 +1,137 @@
+##### Geostrophic wind kernel #####
+
+## This module holds the calculation of the geostrophic wind from geopotential used by "geostrophic_wind.py".
+## The latitude dependent coefficients are computed once as 1-D arrays over latitude and broadcast over time and longitude, so each
+## field (ug, vg, wind speed and wind direction) is evaluated in a single pass over a block of geopotential data.
+## All fields are calculated for the inner gridpoints only, since the centred differences need a neighbour on each side.
+## Long time series are processed in time chunks, so memory use depends on the chunk size and not on the length of the dataset.
+## The signed angle between the geostrophic wind and the 10m wind (alpha, used by "ageostrophic_wind.py") is calculated for whole
+## columns at once.
+## Two backends are available: "numpy" (plain array expressions with metpy for the wind direction) and "fused" (the same formulas
+## written into preallocated arrays without intermediate copies or unit-wrapped arrays). Chunks can be calculated in a thread pool,
+## since numpy releases the GIL inside its array operations.
+
+
+# Import packages:
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+import metpy.calc as mpcalc
+import metpy.units as mpunits
+
+
+## Set constants:
+rad_earth = 6360000                                    # define Earth´s radius, unit: m
+omega = 7.292*10**(-5)                                 # angular velocity of the Earth, unit: 1/s
+
+
+
+## Coefficients for the u- and v-component at the inner latitudes:
+    #Returns two arrays of length nlat-2 (one value per inner latitude, from the first to the last row of the grid).
+    #The latitude is defined from higher to lower, so the grid spacing in latitude is negative.
+def geostrophic_coefficients(lat, lon):
+    lon_degree_grid = (lon[-1]-lon[0])/(len(lon)-1)        # define gridsize ,      unit: degrees
+    lat_degree_grid = (lat[-1]-lat[0])/(len(lat)-1)        # NB! latitude is defined from higher to lower
+    delta_theta = (-lat_degree_grid*2*np.pi)/180           # unit: radians
+    delta_lambda = (lon_degree_grid*2*np.pi)/180           # unit: radians
+
+    latmid = ((lat[0]+(np.arange(1, len(lat)-1)*lat_degree_grid))*np.pi)/180       #latitude in middle of calculation, unit: radians
+    f = 2*omega*np.sin(latmid)                                                      #Coriolis-parameter
+    coeffu = - 1/(f * rad_earth * delta_theta)                                      #coefficient for u-component
+    coeffv =   1/(f * np.cos(latmid) * rad_earth * delta_lambda)                    #coefficient for v-component
+    return np.asarray(coeffu, dtype=np.float64), np.asarray(coeffv, dtype=np.float64)
+
+
+## Geostrophic wind components for a block of geopotential (time, lat, lon) or (time, level, lat, lon):
+    #Returns ug and vg for the inner gridpoints (time, lat-2, lon-2) or (time, level, lat-2, lon-2). All levels are calculated in the
+    #same pass, since the coefficients only depend on latitude.
+def geostrophic_wind(geopotential, coeffu, coeffv):
+    z = np.asarray(geopotential, dtype=np.float64)
+    cu = coeffu[:, np.newaxis]                                                      #broadcast over time (and level) and longitude
+    cv = coeffv[:, np.newaxis]
+    ug = cu * (z[..., 0:-2, 1:-1] - z[..., 2:, 1:-1])                               #centred difference in latitude
+    vg = cv * (z[..., 1:-1, 2:] - z[..., 1:-1, 0:-2])                               #centred difference in longitude
+    return ug, vg
+
+
+## Wind speed and wind direction (direction the wind is blowing from, in degrees) of the geostrophic wind:
+def wind_speed_direction(ug, vg):
+    wind_speed = np.sqrt(ug**2 + vg**2)
+    wind_dir = mpcalc.wind_direction(ug*mpunits.units('m/s'), vg*mpunits.units('m/s'), convention='from').magnitude
+        #Use metpy-library to calculate wind direction. Metpy requires units to be defined for used variables.
+    return wind_speed, wind_dir
+
+
+## Calculate all fields for one chunk of geopotential (time, [level,] lat, lon):
+def geostrophic_fields(geopotential, coeffu, coeffv):
+    ug, vg = geostrophic_wind(geopotential, coeffu, coeffv)
+    wind_speed, wind_dir = wind_speed_direction(ug, vg)
+    return ug, vg, wind_speed, wind_dir
+
+
+## Calculate all fields for one chunk of geopotential in place (fused backend):
+    #Gives the same results as "geostrophic_fields" within float rounding. The wind direction follows metpy´s convention: the
+    #direction the wind is blowing from, in (0, 360] degrees, and 0 for calm (ug = vg = 0).
+def fused_fields(geopotential, coeffu, coeffv):
+    z = np.asarray(geopotential, dtype=np.float64)
+    ug = np.subtract(z[..., 0:-2, 1:-1], z[..., 2:, 1:-1])
+    ug *= coeffu[:, np.newaxis]
+    vg = np.subtract(z[..., 1:-1, 2:], z[..., 1:-1, 0:-2])
+    vg *= coeffv[:, np.newaxis]
+    wind_speed = np.hypot(ug, vg)
+
+    wind_dir = np.negative(vg)
+    np.arctan2(wind_dir, np.negative(ug), out=wind_dir)
+    np.degrees(wind_dir, out=wind_dir)
+    np.subtract(90., wind_dir, out=wind_dir)
+    wind_dir[wind_dir <= 0] += 360.
+    wind_dir[(ug == 0) & (vg == 0)] = 0.                                            #calm
+    return ug, vg, wind_speed, wind_dir
+
+
+backends = {'numpy': geostrophic_fields, 'fused': fused_fields}
+
+
+## Read the geopotential in chunks of "chunk_size" timesteps and yield the fields for each chunk:
+    #"geopotential" can be a netCDF-variable. Chunks are read in the calling thread (netCDF-files can not be read from several threads)
+    #and calculated with the chosen backend. With max_workers > 1 the chunks are calculated in a thread pool, with at most max_workers+1
+    #chunks in memory at once.
+    #Only timesteps from "start" on are calculated (used to extend an existing output file).
+    #Yields (first timestep, last timestep + 1, (ug, vg, wind speed, wind direction)) in time order.
+def geostrophic_chunks(geopotential, coeffu, coeffv, chunk_size=744, backend='numpy', max_workers=1, start=0):
+    ntime = len(geopotential)
+    fields = backends[backend]
+    bounds = [(t0, min(t0 + chunk_size, ntime)) for t0 in range(start, ntime, chunk_size)]
+
+    if max_workers <= 1:
+        for t0, t1 in bounds:
+            yield t0, t1, fields(geopotential[t0:t1], coeffu, coeffv)
+        return
+
+    pending = []                                                                    #(t0, t1, future) in time order
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for t0, t1 in bounds:
+            pending.append((t0, t1, executor.submit(fields, geopotential[t0:t1], coeffu, coeffv)))
+            if len(pending) > max_workers:                                          #at most max_workers+1 chunks in memory at a time
+                t0_done, t1_done, future = pending.pop(0)
+                yield t0_done, t1_done, future.result()
+        while pending:
+            t0_done, t1_done, future = pending.pop(0)
+            yield t0_done, t1_done, future.result()
+
+
+
+## Signed angle alpha from the geostrophic wind (ug, vg) to the 10m wind (u10, v10) in degrees, for whole arrays at once:
+    #alpha = atan2(k·(Vg x V10), Vg·V10) lies in (-180, 180]; it is positive when V10 is turned anticlockwise from Vg (backed).
+    #No wind (Vg or V10 zero) gives 0, and NaN in any component gives NaN.
+def signed_angle(ug, vg, u10, v10):
+    ug, vg, u10, v10 = (np.asarray(x, dtype=np.float64) for x in (ug, vg, u10, v10))
+    cross = ug*v10 - vg*u10 + 0.                                                    #vertical component of the cross product
+    dot = ug*u10 + vg*v10 + 0.                                                      #dot product (+0. turns -0 into +0, so no wind gives 0 and not 180)
+    return np.degrees(np.arctan2(cross, dot))
+
+
+## u- and v-component of a wind given by speed and meteorological direction (direction the wind is blowing from, in degrees):
+def wind_components(speed, direction):
+    radians = np.radians(np.asarray(direction, dtype=np.float64))
+    speed = np.asarray(speed, dtype=np.float64)
+    return -speed*np.sin(radians), -speed*np.cos(radians)
@@ -3,17 +3,34 @@
 
 ## This file calculates the geostrophic wind components (ug and vg), wind speed and wind direction from a netCDF-file containing 
 ## geopotential. A new netCDF-file called "ERA5_ug_vg_wind_speed_wind_dir.nc" is created where the calculated wind parameters are 
-## stored. 
+## stored. The geopotential is read and the wind parameters are calculated and written in time chunks, so the memory use does not 
+## depend on the length of the time series.
+## In append mode an existing output file is extended with the timesteps of the geopotential file that are newer than its last 
+## timestep, so adding a new month of ERA5 data only calculates that month.
+## If the geopotential has a pressure level dimension (e.g. 1000/925/850 hPa), all levels are calculated in the same pass and the new 
+## file gets a "level" dimension. A single level file gives (time, lat, lon) variables as before.
+## The calculation can be restricted to a region and period, in which case only that part of the geopotential is read.
 
 
 # Importing packages:
+import os
 import netCDF4 as nc
 import numpy as np
-import metpy.calc as mpcalc
-import metpy.units as mpunits
-
-
-### Calculate wind parameters:
+from geostrophic_kernel import geostrophic_coefficients, geostrophic_chunks     #Geostrophic wind from geopotential
+from era5_tools import coordinate_names, open_subset                             #Read only a region and period of ERA5-files
+
+
+## Set adjustables:
+nc_chunk_shape = (2190, 8, 8)                          #chunks of the new netCDF-file (time, lat, lon): a quarter year of hourly data on 8x8 tiles
+                                                       #(with pressure levels each chunk holds one level)
+compression_level = 4                                  #zlib compression level of the new netCDF-file (0 for no compression)
+chunk_size = nc_chunk_shape[0]                         #number of timesteps read and calculated at once (same as the file chunks)
+output_file = 'ERA5_ug_vg_wind_speed_wind_dir.nc'      #netCDF-file with the calculated wind parameters
+append_mode = True                                     #True: only calculate timesteps newer than those in output_file, False: recalculate all
+backend = 'fused'                                      #'numpy' (metpy for the wind direction) or 'fused' (in place, fewer temporaries)
+max_workers = min(4, os.cpu_count() or 1)              #number of chunks calculated at the same time (1 for a single core)
+bbox = None                                            #region to calculate (lon_min, lon_max, lat_min, lat_max), e.g. (6.9, 15.4, 54, 58), None: all
+time_range = None                                      #period to calculate (start, end), e.g. ('1990-01-01', '2022-12-31'), None: all
 
 # Define original dataset:
 fn = '/Users/Bianca/Desktop/Thesis_data/ERA5_geopotential_1000hPa_1990-2022.nc'
@@ -23,99 +40,134 @@ print(geopot_file.variables.keys())                    #check variables in datas
 
 
 # Initial definitions:
-lat = geopot_file.variables['latitude'][:]             #store latitude data into a variable
-lon = geopot_file.variables['longitude'][:]            #store longitude data into a variable
-geopotential = geopot_file.variables['z']              #define geopotential variable
-
-
-# Calculate coriolis parameter: 
-rad_earth = 6360000                                    # define Earth´s radius, unit: m
-lon_degree_grid = (lon[-1]-lon[0])/(len(lon)-1)        # define gridsize ,      unit: degrees
-lat_degree_grid = (lat[-1]-lat[0])/(len(lat)-1)             # NB! latitude is defined from higher to lower
-delta_theta = (-lat_degree_grid*2*np.pi)/180           # unit: radians
-delta_lambda = (lon_degree_grid*2*np.pi)/180           # unit: radians
+geopotential, lat, lon, time_values = open_subset(geopot_file, 'z', bbox, time_range, pad=1, level='all')
+    #Define geopotential variable (time, lat, lon) or (time, level, lat, lon) with its latitudes, longitudes and times, restricted to
+    #the region and period. Only this block is read from the file. One extra gridpoint is kept on each side of the region, so the 
+    #whole region is covered by the inner gridpoints.
+level_dim = [dim for dim in geopotential.dimensions if dim in ('level', 'pressure_level')]     #name of the pressure level dimension
+levels = geopot_file.variables[level_dim[0]][:] if level_dim else None                          #pressure levels (None for a single level)
+time_units = getattr(geopot_file.variables[coordinate_names(geopot_file.variables)[2]], 'units', 'hours since 1900-01-01 00:00:00.0')
+    #units of the time values, which are copied to the new file unchanged
 
 
 nlat = len(lat)                                        #number of latitudes
 nlon = len(lon)                                        #number of longitudes
 ntime = len(geopotential)                              #number of timesteps
 
-f = np.zeros( (ntime,nlat,nlon) )                      #Create empty 3D-arrays to contain variables created in loop
-coeffu = np.zeros( (ntime, nlat,nlon) )
-coeffv = np.zeros( (ntime, nlat,nlon) )
-ug = np.zeros( (ntime,nlat,nlon) )
-vg = np.zeros( (ntime,nlat,nlon) )
-wind_speed = np.zeros( (ntime,nlat,nlon) )
-wind_dir = np.zeros( (ntime,nlat,nlon) )
-wind_dir1 = np.zeros( (ntime,nlat,nlon) )
-wind_dir2 = np.zeros( (ntime,nlat,nlon) )
-
-
-# Create loop that itterates through each gridcell by latitude index
-for ilat in range(nlat):                            #set parameters that are time invariant
-   latmid = ((lat[0]+(float(ilat+1)*lat_degree_grid))*np.pi)/180					#latitude in middle of calculation, unit: radians
-   f[:,ilat,:] = 2*7.292*10**(-5)*np.sin(latmid)				                    #Coriolis-parameter
-   coeffu[:,ilat,:] = - 1/(f[:,ilat,:] * rad_earth * delta_theta)                    #coefficient for u-component
-   coeffv[:,ilat,:] =   1/(f[:,ilat,:] * np.cos(latmid) * rad_earth * delta_lambda)	#coefficient for v-component
-
-   #print('Latitude = ',latmid*180/np.pi,'  f = ', f[0,ilat,0],'  coeffu = ',coeffu[0,ilat,0],)#'  coeffv = ',coeffv[0,ilat])
-        #NOTE: latmid goes up to lat=53.5
-
-   ug[:,1:nlat-1,1:nlon-1] = coeffu[:,0:nlat-2, 1:nlon-1] * (geopotential[:,0:nlat-2,1:nlon-1] - geopotential[:,2:nlat,1:nlon-1])
-   vg[:,1:nlat-1,1:nlon-1] = coeffv[:,0:nlat-2, 1:nlon-1] * (geopotential[:,1:nlat-1,2:nlon] - geopotential[:,1:nlat-1,0:nlon-2])
-        ##loops trough all indexes and calculate ug and vg except edges
-        ##latitude index for coeffu and coeffv needs to be cut 2 from end due to its original calculation starts at lat[1]
-   wind_speed[:,1:nlat-1,1:nlon-1] = np.sqrt(ug[:,1:nlat-1,1:nlon-1]**2 + vg[:,1:nlat-1,1:nlon-1]**2)
-   #wind_dir1[:,1:nlat-1,1:nlon-1] = (np.arctan2(vg[:,1:nlat-1,1:nlon-1], ug[:,1:nlat-1,1:nlon-1])) * (180 / np.pi)
-          ## Should work, but doesn´t?
-   wind_dir2[:,1:nlat-1,1:nlon-1] = mpcalc.wind_direction(ug[:,1:nlat-1,1:nlon-1]*mpunits.units('m/s'), vg[:,1:nlat-1,1:nlon-1]*mpunits.units('m/s'), convention='from')
-          ##Use metpy-library to calculate wind direction. Metpy requires units to be defined for used variables. 
-   #print('ug =',ug[:,1:nlat-1,1:nlon-1])
-   #print('vg =',vg[:,1:nlat-1,1:nlon-1])
-   #print('wind speed =',wind_speed[:,1:nlat-1,1:nlon-1])
-   #print('wind dir1 =',wind_dir1[:,1:nlat-1,1:nlon-1])
-   print('wind dir2 =',wind_dir2[:,1:nlat-1,1:nlon-1])
-
-
 
 ### Create a new netCDF-file for storing new variables with their new dimensions: 
 
-# Create new arrays to contain new variables without empty edges:
-ug_inner = ug[:,1:nlat-1,1:nlon-1]
-vg_inner = vg[:,1:nlat-1,1:nlon-1]
-wind_dir_inner = wind_dir2[:,1:nlat-1,1:nlon-1]
-wind_speed_inner = wind_speed[:,1:nlat-1,1:nlon-1]
-
+# Create coordinate arrays without the edges:
 lat_inner = lat[1:-1]                                       #Create latitude array
 lon_inner = lon[1:-1]                                       #Create longitude array
-time_inner = geopot_file.variables['time'][:]               #Define time array as original netCDF-file
+time_inner = time_values                                    #Define time array as original netCDF-file (within the period)
 
 # Create dictionaries with attributes for each variable:
-time_attr_dict = {'standard_name': 'time', 'long_name': 'time', 'units': 'hours since 1900-01-01 00:00:00.0', 'calendar': 'gregorian', 'axis': 'T'}
+time_attr_dict = {'standard_name': 'time', 'long_name': 'time', 'units': time_units, 'calendar': 'gregorian', 'axis': 'T'}
 lon_attr_dict = {'standard_name': 'longitude', 'long_name': 'longitude', 'units': 'degrees_east', 'axis': 'X'}
 lat_attr_dict = {'standard_name': 'latitude', 'long_name': 'latitude', 'units': 'degrees_north', 'axis': 'Y'}
 ug_attr_dict = {'standard_name': 'ug', 'long_name': 'geostrophic_wind_u_component', 'units': 'm/s'}
 vg_attr_dict = {'standard_name': 'vg', 'long_name': 'geostrophic_wind_v_component', 'units': 'm/s'}
 wind_speed_attr_dict = {'standard_name': 'wind_speed', 'long_name': 'wind_speed', 'units': 'm/s'}
 wind_dir_attr_dict = {'standard_name': 'wind_dir', 'long_name': 'wind_direction', 'units': 'degrees'}
+level_attr_dict = {'standard_name': 'air_pressure', 'long_name': 'pressure_level', 'units': 'millibars', 'axis': 'Z'}
+
+# Chunking and compression of the wind variables:
+    #Chunks that are long in time and small in space let a time series at one gridpoint be read from a few chunks, while time means
+    #over the whole grid still read each chunk once. Values are stored as float32 with shuffle and zlib compression.
+    #The time dimension is unlimited, so the time length of the chunks does not depend on the number of timesteps.
+chunksizes = [nc_chunk_shape[0], min(nc_chunk_shape[1], len(lat_inner)), min(nc_chunk_shape[2], len(lon_inner))]
+wind_dims = ('time', 'lat', 'lon')                              #dimensions of the wind variables
+if levels is not None:
+    wind_dims = ('time', 'level', 'lat', 'lon')
+    chunksizes.insert(1, 1)
+var_options = {'chunksizes': chunksizes, 'zlib': compression_level > 0, 'complevel': max(compression_level, 1), 'shuffle': True}
+
+## Open the existing file in append mode, if its time dimension can be extended:
+    #The stored file must have the same dimensions, grid (latitudes, longitudes and levels) and time units, otherwise appending would
+    #mix values of different regions or times, and all timesteps are recalculated instead.
+first_new = 0                                                   #first timestep of the geopotential file that is not in the output file
+if append_mode and os.path.exists(output_file):
+    netCDF_new = nc.Dataset(output_file, 'a')
+    stored_vars = netCDF_new.variables
+    if (netCDF_new.dimensions['time'].isunlimited() and stored_vars['ug'].dimensions == wind_dims
+            and stored_vars['ug'].shape[1:] == geopotential.shape[1:-2] + (len(lat_inner), len(lon_inner))
+            and np.array_equal(stored_vars['lat'][:], np.float32(lat_inner)) and np.array_equal(stored_vars['lon'][:], np.float32(lon_inner))
+            and (levels is None or np.array_equal(stored_vars['level'][:], np.int32(levels)))
+            and getattr(stored_vars['time'], 'units', None) == time_units):
+        stored_time = np.ma.asarray(netCDF_new.variables['time'][:])
+        n_stored = int(np.ma.count(stored_time))                #timesteps with a stored time (their data is complete, see below)
+            #Timesteps after them (data written by an interrupted run before its time values) are overwritten.
+        if n_stored > 0:
+            first_new = int(np.searchsorted(time_inner, stored_time[n_stored-1], side='right'))
+        print('Appending', ntime - first_new, 'new timesteps to', output_file)
+    else:
+        print('The time dimension, grid or time units of', output_file, 'do not match, recalculating all timesteps')
+        netCDF_new.close()
+        netCDF_new = None
+else:
+    netCDF_new = None
 
 ## Create new netCDF4-file:
-netCDF_new = nc.Dataset('ERA5_ug_vg_wind_speed_wind_dir.nc','w');
-netCDF_new.createDimension('lon', len(lon_inner));               #Create longitude, latitude and time dimensions
-netCDF_new.createDimension('lat', len(lat_inner));
-netCDF_new.createDimension('time', ntime);
-# Create netCDF-variables with attribute list and values from previously created arrays:
-lonvar = netCDF_new.createVariable('lon','float32',('lon')); lonvar.setncatts(lon_attr_dict); lonvar[:] = lon_inner;
-latvar = netCDF_new.createVariable('lat','float32',('lat')); latvar.setncatts(lat_attr_dict); latvar[:] = lat_inner;
-timevar = netCDF_new.createVariable('time','int32',('time')); timevar.setncatts(time_attr_dict); timevar[:] = time_inner;
-ugvar = netCDF_new.createVariable('ug','float32',('time','lat','lon')); ugvar.setncatts(ug_attr_dict); ugvar[:] = ug_inner;
-vgvar = netCDF_new.createVariable('vg','float32',('time','lat','lon')); vgvar.setncatts(vg_attr_dict); vgvar[:] = vg_inner;
-wind_speed_var = netCDF_new.createVariable('wind_speed','float32',('time','lat','lon')); wind_speed_var.setncatts(wind_speed_attr_dict); wind_speed_var[:] = wind_speed_inner;
-wind_dir_var = netCDF_new.createVariable('wind_dir','float32',('time','lat','lon')); wind_dir_var.setncatts(wind_dir_attr_dict); wind_dir_var[:] = wind_dir_inner;
+if netCDF_new is None:
+    n_stored = 0
+    netCDF_new = nc.Dataset(output_file,'w');
+    netCDF_new.createDimension('lon', len(lon_inner));               #Create longitude, latitude and time dimensions
+    netCDF_new.createDimension('lat', len(lat_inner));
+    netCDF_new.createDimension('time', None);                        #unlimited, so new timesteps can be appended later
+    if levels is not None:
+        netCDF_new.createDimension('level', len(levels));
+        levelvar = netCDF_new.createVariable('level','int32',('level')); levelvar.setncatts(level_attr_dict); levelvar[:] = levels;
+    # Create netCDF-variables with attribute list and values from previously created arrays:
+    lonvar = netCDF_new.createVariable('lon','float32',('lon')); lonvar.setncatts(lon_attr_dict); lonvar[:] = lon_inner;
+    latvar = netCDF_new.createVariable('lat','float32',('lat')); latvar.setncatts(lat_attr_dict); latvar[:] = lat_inner;
+    timevar = netCDF_new.createVariable('time','int32',('time')); timevar.setncatts(time_attr_dict);
+    ugvar = netCDF_new.createVariable('ug','float32',wind_dims, **var_options); ugvar.setncatts(ug_attr_dict);
+    vgvar = netCDF_new.createVariable('vg','float32',wind_dims, **var_options); vgvar.setncatts(vg_attr_dict);
+    wind_speed_var = netCDF_new.createVariable('wind_speed','float32',wind_dims, **var_options); wind_speed_var.setncatts(wind_speed_attr_dict);
+    wind_dir_var = netCDF_new.createVariable('wind_dir','float32',wind_dims, **var_options); wind_dir_var.setncatts(wind_dir_attr_dict);
+
+timevar = netCDF_new.variables['time']
+ugvar = netCDF_new.variables['ug']
+vgvar = netCDF_new.variables['vg']
+wind_speed_var = netCDF_new.variables['wind_speed']
+wind_dir_var = netCDF_new.variables['wind_dir']
+
+# Let the chunk cache of each variable hold one row of chunks over the whole grid, so each chunk is compressed and written once:
+chunk_time, chunk_lat, chunk_lon = ugvar.chunking()[0], ugvar.chunking()[-2], ugvar.chunking()[-1]
+nlevel = len(levels) if levels is not None else 1
+chunk_row_bytes = 4 * chunk_time * nlevel * (-(-len(lat_inner) // chunk_lat) * chunk_lat) * (-(-len(lon_inner) // chunk_lon) * chunk_lon)
+for var in (ugvar, vgvar, wind_speed_var, wind_dir_var):
+    var.set_var_chunk_cache(size=chunk_row_bytes + 2**20)
+
+
+### Calculate wind parameters:
+
+# Calculate the coefficients for the u- and v-component (Coriolis-parameter and grid spacing) once for each inner latitude:
+coeffu, coeffv = geostrophic_coefficients(lat, lon)
+    #NOTE: latmid goes up to lat=53.5
+
+# Calculate ug, vg, wind speed and wind direction chunk by chunk and write each chunk directly into the netCDF-file:
+    #The coefficients are broadcast over time and longitude, all fields are calculated for the inner gridpoints (without edges).
+    #Only a few chunks of geopotential and calculated fields (at most max_workers+1) are held in memory at a time.
+    #Timesteps already in the output file are skipped, new timesteps are written after the stored ones.
+    #The time values of a chunk are written after its data and the file is synced, so a stored time always has its data stored
+    #(an interrupted run is continued from the last stored time).
+chunks = geostrophic_chunks(geopotential, coeffu, coeffv, chunk_size, backend, max_workers, start=first_new)
+for t0, t1, (ug_inner, vg_inner, wind_speed_inner, wind_dir_inner) in chunks:
+    o0, o1 = n_stored + t0 - first_new, n_stored + t1 - first_new              #position in the output file
+    ugvar[o0:o1] = ug_inner
+    vgvar[o0:o1] = vg_inner
+    wind_speed_var[o0:o1] = wind_speed_inner
+    wind_dir_var[o0:o1] = wind_dir_inner
+    timevar[o0:o1] = time_inner[t0:t1]                                          #last, marks the chunk as complete
+    netCDF_new.sync()
+    print('Calculated timesteps', t0, 'to', t1, 'of', ntime)
+
 netCDF_new.close();
 
 # Print new netCDF:
-new_netCDF = nc.Dataset('ERA5_ug_vg_wind_speed_wind_dir.nc', 'r')
+new_netCDF = nc.Dataset(output_file, 'r')
 
 
 
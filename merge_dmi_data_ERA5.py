@@ -2,8 +2,11 @@
 ## Author: Bianca E. Sandvik (March 2023)
 
 ## This script merges DMI data with ERA5 data for each individual station. The closest gridpoint in the ERA5 dataset is coupled to 
-## the DMI data based on nearest longitude and latitude coordinates. The script takes the monthly and yearly means for each station
-## and saves them to individual parquet-files with the DMI-station location.
+## the DMI data based on nearest longitude and latitude coordinates, for each position the station has had. The script takes the 
+## daily, monthly, seasonal and yearly means for each station in one pass (each from the finer one), and saves them to parquet 
+## datasets partitioned by station and year ("dmi_dataset.py") with the DMI-station location and the number of valid samples.
+## In hourly merge mode the 10 min DMI data is also aligned to the hourly ERA5 times (nearest observation or hourly mean) and stored
+## with the ERA5 data in "DMI_ERA5_hourly". This is done one station-year at a time, so the full 10 min series is never in memory.
 ## The output-files contain means with: time, DMI-station longitude and latitude coordinates, DMI wind speed, DMI wind direction, 
 ## ERA5 geostrophic wind components (ug and vg), ERA5 wind speed, and ERA5 wind direction.
 
@@ -11,13 +14,24 @@
 import netCDF4 as nc
 import pandas as pd
 import numpy as np
-import fastparquet as parq          # For saving generated files to parquet-format
-import glob                         # For searching files in current directory
-import xarray as xr                 # For converting netCDF-files to dataset
+from dmi_timeseries import align_to_times, locations_at, rollups, runs_at     # Time alignment, means and station location at given times
+from dmi_dataset import read_dataset, station_frames, station_years, write_station   # Station and year partitioned parquet datasets
+from era5_tools import coordinate_names, extract_points, nearest_gridpoints  # ERA5 time series at the stations
 
-# Import ERA5 datafile:
+# ERA5 datafile (only opened when ERA5 series have to be extracted):
 fn = '/Users/Bianca/Desktop/Thesis_data/ERA5_ug_vg_wind_speed_wind_dir.nc'
-ERA5 = nc.Dataset(fn, 'r')
+
+## Set adjustables:
+era5_time_range = None                      #period of the ERA5 data (start, end), e.g. ('1990-01-01', '2022-12-31'), None: all
+era5_variables = ['ug', 'vg', 'wind_speed', 'wind_dir']     #ERA5 variables extracted at the stations
+era5_level = 1000                           #pressure level of the ERA5 variables (hPa), used if the ERA5 file has several levels
+refresh_era5_points = False                 #True: extract all stations again (e.g. after new timesteps are added to the ERA5 file)
+min_coverage = 0.8                          #smallest fraction of valid samples for a daily/monthly/seasonal/yearly mean (else NaN)
+rollup_periods = ['daily', 'monthly', 'seasonal', 'yearly']     #means stored in "DMI_ERA5_<period>"
+hourly_merge = True                         #True: also store the DMI data aligned to the hourly ERA5 times in "DMI_ERA5_hourly"
+hourly_rule = 'nearest'                     #'nearest': DMI observation nearest to each hour, 'mean': mean over the hour centred on it
+hourly_tolerance = '10min'                  #largest time difference for the 'nearest' rule
+hourly_window = '1H'                        #length of the window for the 'mean' rule
 
 
 # Define list of DMI stations:
@@ -33,100 +47,139 @@ DMIstations = pd.DataFrame (stationlist, columns = ['Station_ID', 'Station_name'
 
 st_ID = list(DMIstations['Station_ID'])                                 #create list of all station IDs
 
+
+### Extract the ERA5 time series at the stations:
+    #Every position of every station (one row per position in "dmi_location") is mapped to its nearest ERA5 gridpoint in one query of
+    #a spatial index over the grid. The series of all gridpoints used by the stations are extracted in one pass over the ERA5 file,
+    #and each station gets the series of the gridpoint of the position it had at each time, so stations that moved to another
+    #gridpoint are merged with the right series. The series are stored in the "ERA5_points" dataset (one per station) and the
+    #gridpoint (Grid_Lat, Grid_Lon) of each position in "ERA5_point_grid", together with the ERA5 file and level. Only stations that
+    #are not stored yet, or whose positions, ERA5 file or level have changed, are extracted. Later merges read the stored series and
+    #gridpoints and do not open the ERA5 file.
+
+# Stations to extract:
+DMI_locations = read_dataset('dmi_location', st_ID)                                 #station locations (one row per position)
+DMI_locations['ERA5_file'] = fn
+DMI_locations['ERA5_level'] = np.float32(era5_level)
+point_grid = {station: location.drop(columns='Station_ID').reset_index(drop=True) for station, location in DMI_locations.groupby('Station_ID')}
+position_columns = ['Start', 'Longitude', 'Latitude', 'ERA5_file', 'ERA5_level']
+stored_grid = read_dataset('ERA5_point_grid', list(point_grid))
+stored_grid = {station: location.drop(columns='Station_ID').reset_index(drop=True)
+               for station, location in stored_grid.groupby('Station_ID')} if len(stored_grid) > 0 else {}
+extract = [station for station in point_grid if refresh_era5_points or station not in stored_grid
+           or not set(position_columns) <= set(stored_grid[station].columns)
+           or not stored_grid[station][position_columns].equals(point_grid[station][position_columns])]
+point_grid.update({station: stored_grid[station] for station in point_grid if station not in extract})     #stored gridpoints
+
+if len(extract) > 0:
+    # Nearest ERA5 gridpoint of each position of the stations to extract:
+    with nc.Dataset(fn, 'r') as ERA5:
+        lat_name, lon_name, _ = coordinate_names(ERA5.variables)
+        ERA5_lat = ERA5.variables[lat_name][:]
+        ERA5_lon = ERA5.variables[lon_name][:]
+    positions = pd.concat([point_grid[station] for station in extract], keys=extract)
+    ilat, ilon, distance = nearest_gridpoints(ERA5_lat, ERA5_lon, positions.Latitude, positions.Longitude)
+    positions['Grid_Lat'] = np.asarray(ERA5_lat[ilat], dtype=np.float32)
+    positions['Grid_Lon'] = np.asarray(ERA5_lon[ilon], dtype=np.float32)
+    point_grid.update({station: positions.loc[station].reset_index(drop=True) for station in extract})
+    print('Largest distance from a station position to its ERA5 gridpoint:', round(float(distance.max()), 1), 'km')
+
+    print('Extracting ERA5 time series for stations:', extract)
+    cells = pd.concat([point_grid[station] for station in extract]).drop_duplicates(['Grid_Lat', 'Grid_Lon'])     #gridpoints used
+    cells = cells.set_index(['Grid_Lat', 'Grid_Lon']).index
+    times, _, _, series = extract_points(fn, cells.get_level_values(0), cells.get_level_values(1), era5_variables, era5_time_range,
+                                         level=era5_level)
+    for station in extract:
+        location = point_grid[station]
+        run = runs_at(location, times)                                  #station position at each ERA5 time
+        cell = cells.get_indexer(pd.MultiIndex.from_frame(location[['Grid_Lat', 'Grid_Lon']]))[run]     #and its gridpoint
+        rows = np.arange(len(times))
+        ERA5_station = pd.DataFrame({name: series[name][rows, cell] for name in era5_variables}, index=times)
+        ERA5_station['Grid_Lon'] = location.Grid_Lon.to_numpy()[run]
+        ERA5_station['Grid_Lat'] = location.Grid_Lat.to_numpy()[run]
+        write_station('ERA5_points', station, ERA5_station)
+        write_station('ERA5_point_grid', station, location)
+
 for station in st_ID:
-    glob_string = 'dmi_data_' + station + '.parq.gzip'                  #Create a dynamic string for input to search for station specific parquet-files
-    dmi_ERA5_zip = glob.glob(glob_string)                                   #Find station specific parquet-files in current directory
-    for i in dmi_ERA5_zip:
-        DMI_parq = pd.read_parquet(i)                                   #Read and print parquet-file
+    dmi_ERA5_zip = station_frames('dmi_data', station)                 #Read station specific data from the dataset (empty if not stored)
+    for DMI_parq in dmi_ERA5_zip:                                       #DMI data with UTC time index, float32 wind speed and direction
+        DMI_location = station_frames('dmi_location', station)[0]      #Read the station locations (one row per position)
         #print(DMI_parq)
 
-        # Define longitude and lattude coordinates for DMI data:
-        DMI_parq['Longitude, Latitude'].bfill(inplace=True)             #backward fill lon-/lat-values where None-values are present
-        DMI_parq['Longitude, Latitude'].ffill(inplace=True)             #forward fill lon-/lat-values where None-values are present
-            #Filling of missing location values are necessary to avoid TypeError.
-        lon_dmi = DMI_parq['Longitude, Latitude'][0][0]                                             #starting position
-        lat_dmi = DMI_parq['Longitude, Latitude'][0][1]
-        lon_dmi_end = DMI_parq['Longitude, Latitude'][len(DMI_parq['Longitude, Latitude'])-1][0]    #ending position
-        lat_dmi_end = DMI_parq['Longitude, Latitude'][len(DMI_parq['Longitude, Latitude'])-1][1]
-
-        # Convert ERA5 data as xarray and select data from ERA5 that has the nearest location to the DMI data:
-        ERA5_xr = xr.open_dataset('ERA5_ug_vg_wind_speed_wind_dir.nc') 
-        ERA5_st = ERA5_xr.sel(lon=lon_dmi, lat=lat_dmi, method="nearest")                #select ERA5-data based on DMI station´s first location
-        ERA5_st_end = ERA5_xr.sel(lon=lon_dmi_end, lat=lat_dmi_end, method="nearest")    #select ERA5-data based on DMI station´s final location
-
-        #Control if a change in location changes the "corresponding" ERA5 grid 
-        if ERA5_st == ERA5_st_end:                                            
+        # Report if a change in location changes the "corresponding" ERA5 grid:
+        n_grid = len(point_grid[station].drop_duplicates(['Grid_Lat', 'Grid_Lon']))
+        if n_grid == 1:
             print('Corresponding ERA5 grid location is unchanged for station:', station)
         else: 
-            print('WARNING! Corresponding ERA5 grid location is changed for station:', station)
-            break
+            print('Corresponding ERA5 grid location changes between', n_grid, 'gridpoints for station:', station)
 
-        # Convert xarray to pandas DataFrame and sort by descending time:
-        ERA5_st_pd = ERA5_st.to_pandas().sort_values('time', ascending=False)
+        # ERA5-data at the gridpoint nearest to the DMI station´s position at each time (UTC time index):
+        ERA5_st_pd = station_frames('ERA5_points', station, columns=era5_variables)[0]
 
-        ## Create monthly and yearly means for ERA5 station data:
-        ERA5_st_monthly = ERA5_st_pd.resample('M').mean()               #create monthly means of all variables
-        ERA5_st_yearly = ERA5_st_pd.resample('Y').mean()                #create monthly means of all variables
-        #era_month = ERA5_st_pd[0:744].mean()                               #control for last month and year
-        #era_yr = ERA5_st_pd[0:8760].mean()
+        ## Create daily, monthly, seasonal and yearly means for ERA5 and DMI station data in one pass each:
+            #Wind directions are averaged through the u- and v-components, and means with less than min_coverage of the expected
+            #samples are NaN (not the DMI location). The number of valid samples is stored with each mean ("<column>_count", "..._expected_count").
+        ERA5_st_means = rollups(ERA5_st_pd, freq='1H', directions={'wind_dir': 'wind_speed'}, min_coverage=min_coverage)
 
-        ## Create monthly and yearly means for DMI station data:
-        DMI_parq.set_index('Time', inplace=True)                        #set time as index
-        DMI_parq.index = pd.to_datetime(DMI_parq.index)                 #convert time to datetime
-
-        # Create lists to hold separate longitude and latitude variables from DMI station data:
+        # Create columns with the DMI station location at each time:
             #This is necessary to keep the location when we take the mean.
-        lon_list = []
-        for i in range(len(DMI_parq['Longitude, Latitude'])):
-            longitude = DMI_parq['Longitude, Latitude'][i][0]           #Append the 1st entry in the lon/lat-list
-            lon_list.append(longitude) 
-
-        lat_list = []
-        for i in range(len(DMI_parq['Longitude, Latitude'])):
-            latitude = DMI_parq['Longitude, Latitude'][i][1]           #Append the 2nd entry in the lon/lat-list
-            lat_list.append(latitude) 
-
-        # Create new columns containing our new longitude and latitude lists:
-        DMI_parq.insert(1, 'DMI_Lon', lon_list)
-        DMI_parq.insert(2, 'DMI_Lat', lat_list)
+        lon_list, lat_list = locations_at(DMI_location, DMI_parq.index)
+        DMI_parq.insert(0, 'DMI_Lon', lon_list)
+        DMI_parq.insert(1, 'DMI_Lat', lat_list)
 
         DMI_parq = DMI_parq.rename(columns={"Wind speed": "DMI_wind_speed", "Wind direction": "DMI_wind_dir"})   #rename columns
-
-        # Create DMI datasets with means:
-        dmi_st_monthly = DMI_parq.resample('M').mean()              #create monthly means of all variables
-        dmi_st_yearly = DMI_parq.resample('Y').mean()               #create yearly means of all variables
-        #dmi_month = DMI_parq[0:4464].mean()                            #control for last month and year
-        #dmi_yr = DMI_parq[0:52560].mean()
+        dmi_st_means = rollups(DMI_parq, freq='10T', directions={'DMI_wind_dir': 'DMI_wind_speed'}, min_coverage=min_coverage,
+                               location_columns=['DMI_Lon', 'DMI_Lat'])          #the location is kept also for partial periods
 
 
         ### Insert ERA5-variables into new columns in the DMI datasets and store as parquet-files:
-        ## Monthly:
-        dmi_st_monthly['ERA5_ug'] = list(ERA5_st_monthly['ug'])
-        dmi_st_monthly['ERA5_vg'] = list(ERA5_st_monthly['vg'])
-        dmi_st_monthly['ERA5_wind_speed'] = list(ERA5_st_monthly['wind_speed'])
-        dmi_st_monthly['ERA5_wind_dir'] = list(ERA5_st_monthly['wind_dir'])
+        for period in rollup_periods:
+            ERA5_st_period = ERA5_st_means[period].rename(columns=lambda column: 'ERA5_' + column)
+            ERA5_st_period = ERA5_st_period.rename(columns={'ERA5_Expected_count': 'ERA5_expected_count'})
+            dmi_st_period = dmi_st_means[period].rename(columns={'Expected_count': 'DMI_expected_count'})
+            dmi_st_period = dmi_st_period.join(ERA5_st_period)                      #ERA5 means of the same periods
 
-        # Store as parquet-file: 
-        namegenerator_parq = 'DMI_ERA5_' + station + '_monthly.parq.gzip'       #Create dynamic naming based on station ID for parquet-file
-        dmi_st_monthly.to_parquet(namegenerator_parq, compression='gzip')       #Create station specific parquet-file
+            # Store in the dataset: 
+            write_station('DMI_ERA5_' + period, station, dmi_st_period)            #Station specific partitions in "dmi_dataset/DMI_ERA5_<period>"
 
-        print_parquet_month = pd.read_parquet(namegenerator_parq)               #Print
+        print_parquet_month = station_frames('DMI_ERA5_monthly', station)[0]   #Print
         print('Printing monthly means for station', station, ':')
         print_parquet_month
 
-
-        ## Yearly:
-        dmi_st_yearly['ERA5_ug'] = list(ERA5_st_yearly['ug'])
-        dmi_st_yearly['ERA5_vg'] = list(ERA5_st_yearly['vg'])
-        dmi_st_yearly['ERA5_wind_speed'] = list(ERA5_st_yearly['wind_speed'])
-        dmi_st_yearly['ERA5_wind_dir'] = list(ERA5_st_yearly['wind_dir'])
-        
-        # Store as parquet-file: 
-        namegenerator_parq = 'DMI_ERA5_' + station + '_yearly.parq.gzip'        #Create dynamic naming based on station ID for parquet-file
-        dmi_st_yearly.to_parquet(namegenerator_parq, compression='gzip')        #Create station specific parquet-file
-
-        print_parquet_year = pd.read_parquet(namegenerator_parq)                #Print
+        print_parquet_year = station_frames('DMI_ERA5_yearly', station)[0]     #Print
         print('Printing yearly means for station', station, ':')
         print_parquet_year
 
 
+
+
+### Hourly merge:
+    #For each station-year the 10 min DMI data (with a margin for the tolerance or window at the turn of the year) and the ERA5 series
+    #of the station are read, and the DMI data is aligned to the ERA5 times. The hourly years of a station are then stored together.
+if hourly_merge:
+    margin = max(pd.Timedelta(hourly_tolerance), pd.Timedelta(hourly_window)/2)
+    for station in st_ID:
+        DMI_location = station_frames('dmi_location', station)
+        hourly = []
+        for year in station_years('dmi_data', station):
+            start = pd.Timestamp(year=year, month=1, day=1, tz='UTC')
+            end = pd.Timestamp(year=year+1, month=1, day=1, tz='UTC') - pd.Timedelta(1, 'ns')
+            ERA5_year = station_frames('ERA5_points', station, start, end, columns=era5_variables)
+            DMI_year = station_frames('dmi_data', station, start - margin, end + margin)
+            if len(ERA5_year) == 0 or len(DMI_year) == 0 or len(DMI_location) == 0:
+                continue
+            ERA5_year, DMI_year = ERA5_year[0], DMI_year[0]
+
+            dmi_hourly = align_to_times(DMI_year, ERA5_year.index, hourly_rule, hourly_tolerance, hourly_window,
+                                        direction_columns=['Wind direction'])
+            dmi_hourly = dmi_hourly.rename(columns={"Wind speed": "DMI_wind_speed", "Wind direction": "DMI_wind_dir"})
+            lon_list, lat_list = locations_at(DMI_location[0], dmi_hourly.index)
+            dmi_hourly.insert(0, 'DMI_Lon', lon_list)
+            dmi_hourly.insert(1, 'DMI_Lat', lat_list)
+            for name in era5_variables:
+                dmi_hourly['ERA5_' + name] = ERA5_year[name].to_numpy()
+            hourly.append(dmi_hourly)
+
+        if len(hourly) > 0:
+            write_station('DMI_ERA5_hourly', station, pd.concat(hourly))           #Station specific partitions in "dmi_dataset/DMI_ERA5_hourly"
+            print('Stored hourly DMI and ERA5 data for station', station)
@@ -0,0 +1,225 @@
+##### Mock DMI API server #####
+
+## This script runs a local stand-in for DMIs metObs API ("/v2/metObs/collections/observation/items"), so that the download stage
+## can be tested and benchmarked without network access or an API-key.
+## It serves synthetic 10 min observations with the same GeoJSON schema as the real API (properties.observed, properties.value,
+## geometry.coordinates, ...) and understands the limit, offset, stationId, parameterId, datetime and sortorder query parameters.
+## Latency, the maximum page size and throttling (429 responses) can be configured. Generated responses can be cached so that
+## repeated benchmark runs measure the downloader rather than the mock.
+
+
+# Import packages:
+import json
+import time
+import gzip
+import threading
+import zlib
+from datetime import datetime, timedelta, timezone
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+## Set adjustables (used when the script is run directly):
+host = '127.0.0.1'
+port = 8000
+latency = 0.05                              #seconds added to every response
+page_limit = 300000                         #maximum number of returned observations per request
+throttle_rate = None                        #requests per second before answering 429 (None for no throttling)
+missing_fraction = 0.05                     #fraction of 10 min slots without observation
+data_start = '1990-01-01T00:00:00Z'         #first and last synthetic observation
+data_end = '2023-01-01T00:00:00Z'
+
+path = '/v2/metObs/collections/observation/items'
+step = timedelta(minutes=10)
+
+
+
+### Synthetic observations:
+
+def parse_time(time_string):
+    return datetime.fromisoformat(time_string.replace('Z', '+00:00'))
+
+def format_time(time):
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+## Check if a 10 min slot has an observation (deterministic for station and slot):
+def has_observation(station_key, slot, missing_fraction):
+    return (zlib.crc32(b'%d/%d' % (station_key, slot)) % 10000) >= missing_fraction * 10000
+
+
+## Value of a parameter at a station and slot:
+def observation_value(parameter, station_key, slot):
+    phase = (slot % 144) / 144 + (station_key % 7) / 7              #daily cycle shifted per station
+    if parameter == 'wind_dir':
+        return float((slot * 7 + station_key) % 360)
+    return round(5 + 4 * abs(phase % 1 - 0.5) + (slot % 13) / 10, 1)
+
+
+## Station location (moves a little once, in 2000, like some real stations do):
+def station_location(station_key, slot_time):
+    lon = 8 + (station_key % 700) / 100
+    lat = 54.6 + (station_key % 300) / 100
+    if slot_time >= datetime(2000, 11, 22, tzinfo=timezone.utc) and station_key % 5 == 0:
+        lat = lat + 0.01
+    return [round(lon, 4), round(lat, 4)]
+
+
+
+### Request handler:
+
+class MockDMIHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'                                   #keep-alive connections like the real API
+    settings = {}
+    stats = {'requests': 0, 'throttled': 0, 'features': 0}
+    lock = threading.Lock()
+    tokens = None
+    last = time.monotonic()
+    cache = {}
+
+    def log_message(self, *args):
+        pass
+
+    def send_body(self, status, body, content_type='application/json', headers={}):
+        if 'gzip' in self.headers.get('Accept-Encoding', '') and self.settings['compress']:
+            body = gzip.compress(body, compresslevel=1)
+            headers = dict(headers, **{'Content-Encoding': 'gzip'})
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    # Token bucket for throttling, returns the seconds to wait or 0 if the request may pass:
+    def throttle(self):
+        rate = self.settings['throttle_rate']
+        if rate is None:
+            return 0
+        with self.lock:
+            cls = type(self)
+            now = time.monotonic()
+            if cls.tokens is None:
+                cls.tokens = rate
+            cls.tokens = min(rate, cls.tokens + (now - cls.last) * rate)
+            cls.last = now
+            if cls.tokens >= 1:
+                cls.tokens = cls.tokens - 1
+                return 0
+            return (1 - cls.tokens) / rate
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == '/stats':                                    #counters for the benchmark
+            with self.lock:
+                self.send_body(200, json.dumps(self.stats).encode())
+            return
+        if url.path != path:
+            self.send_body(404, b'{"message": "not found"}')
+            return
+
+        wait = self.throttle()
+        with self.lock:
+            self.stats['requests'] = self.stats['requests'] + 1
+            if wait > 0:
+                self.stats['throttled'] = self.stats['throttled'] + 1
+        if wait > 0:
+            self.send_body(429, b'{"message": "API rate limit exceeded"}', headers={'Retry-After': '%.2f' % wait})
+            return
+        time.sleep(self.settings['latency'])
+
+        if self.path in self.cache:
+            body, n = self.cache[self.path]
+        else:
+            body, n = self.features_body(parse_qs(url.query))
+            if self.settings['cache_responses']:
+                with self.lock:
+                    self.cache[self.path] = (body, n)
+        with self.lock:
+            self.stats['features'] = self.stats['features'] + n
+        self.send_body(200, body, 'application/geo+json')
+
+    # Build the FeatureCollection for a query:
+    def features_body(self, query):
+        settings = self.settings
+        limit = min(int(query.get('limit', ['1000'])[0]), settings['page_limit'])
+        offset = int(query.get('offset', ['0'])[0])
+        station = query.get('stationId', ['06041'])[0]
+        parameter = query.get('parameterId', ['wind_speed'])[0]
+        descending = query.get('sortorder', ['observed,DESC'])[0].upper().endswith('DESC')
+        start, end = settings['data_start'], settings['data_end']
+        if 'datetime' in query:
+            first, _, last = query['datetime'][0].partition('/')
+            if first not in ('', '..'):
+                start = max(start, parse_time(first))
+            if last not in ('', '..'):
+                end = min(end, parse_time(last))
+            if not last:                                            #single instant
+                end = start
+
+        station_key = int(''.join(c for c in station if c.isdigit()) or 0)
+        t0 = settings['data_start']
+        first_slot = max(0, -(-(start - t0) // step))               #first slot at or after start
+        last_slot = (end - t0) // step
+        slots = range(last_slot, first_slot - 1, -1) if descending else range(first_slot, last_slot + 1)
+
+        features = []
+        skipped = 0
+        for slot in slots:
+            if len(features) >= limit:
+                break
+            if not has_observation(station_key, slot, settings['missing_fraction']):
+                continue
+            if skipped < offset:
+                skipped = skipped + 1
+                continue
+            slot_time = t0 + slot * step
+            observed = format_time(slot_time)
+            lon, lat = station_location(station_key, slot_time)
+            features.append('{"geometry":{"coordinates":[%r,%r],"type":"Point"},"properties":{"created":"%s","observed":"%s",'
+                            '"parameterId":"%s","stationId":"%s","value":%r},"type":"Feature","id":"%08x-%s"}'
+                            % (lon, lat, observed, observed, parameter, station, observation_value(parameter, station_key, slot), slot, station))
+
+        links = [{'href': self.path, 'rel': 'self', 'type': 'application/geo+json', 'title': 'This document'}]
+        if len(features) == limit:
+            links.append({'href': self.path + '&offset=' + str(offset + limit), 'rel': 'next', 'type': 'application/geo+json', 'title': 'Next set of results'})
+        body = ('{"type":"FeatureCollection","features":[' + ','.join(features) + '],"timeStamp":"'
+                + format_time(datetime.now(timezone.utc)) + '","numberReturned":' + str(len(features)) + ',"links":' + json.dumps(links) + '}')
+        return body.encode(), len(features)
+
+
+
+### Start the server:
+
+## Start a mock server in a background thread and return it (server.server_address holds host and port):
+def start_server(host=host, port=port, latency=latency, page_limit=page_limit, throttle_rate=throttle_rate,
+                 missing_fraction=missing_fraction, data_start=data_start, data_end=data_end, compress=False, cache_responses=False):
+    handler = type('Handler', (MockDMIHandler,), {})                #own settings and counters for each server
+    handler.settings = {'latency': latency, 'page_limit': page_limit, 'throttle_rate': throttle_rate,
+                        'missing_fraction': missing_fraction, 'data_start': parse_time(data_start),
+                        'data_end': parse_time(data_end), 'compress': compress, 'cache_responses': cache_responses}
+    handler.stats = {'requests': 0, 'throttled': 0, 'features': 0}
+    handler.lock = threading.Lock()
+    handler.tokens = None
+    handler.cache = {}
+    handler.last = time.monotonic()
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+## Base URL to pass to the downloader for a running server:
+def server_base_url(server):
+    return 'http://%s:%d/v2/metObs/collections/observation' % server.server_address
+
+
+if __name__ == '__main__':
+    server = start_server()
+    print('Mock DMI API running on', server_base_url(server))
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
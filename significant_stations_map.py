@@ -7,7 +7,7 @@
 # Import packages:
 import pandas as pd
 import numpy as np
-import glob       
+from dmi_dataset import read_dataset     #Station and year partitioned parquet datasets
 import pandas as pd
 import matplotlib.pyplot as plt
 from matplotlib.lines import Line2D
@@ -30,18 +30,12 @@ st_ID = list(DMIstations['Station_ID'])                                 #create
 
 
 ## Insert the last longitude and latitude position for each station into dataframe:
-lon_list = []                                                           #create empty list to hold location variables
-lat_list = []
+location_df = read_dataset('DMI_ERA5_monthly', st_ID, columns=['DMI_Lon', 'DMI_Lat'])      #read only the locations of all stations at once
+last_location = location_df.groupby('Station_ID').tail(1).set_index('Station_ID')     #final position of each station
+stored_st = [station for station in st_ID if station in last_location.index]         #stations in the dataset
 
-for station in st_ID:
-    glob_string = 'DMI_ERA5_' + station + '_monthly.parq.gzip'          #Create a dynamic string for input to search for station specific parquet-files
-    dmi_ERA5_zip = glob.glob(glob_string)                               #Find station specific parquet-files in current directory
-    for i in dmi_ERA5_zip:
-        df = pd.read_parquet(i)                                         #Read and print parquet-file
-        #print(df)
-
-        lon_list.append(df.DMI_Lon[-1])                                 #insert final longitude position into list
-        lat_list.append(df.DMI_Lat[-1])                                 #insert final longitude position into list
+lon_list = list(last_location.loc[stored_st, 'DMI_Lon'])                #list of final longitude positions
+lat_list = list(last_location.loc[stored_st, 'DMI_Lat'])                #list of final latitude positions
 
 DMIstations.insert(2,'Longitude', lon_list)                             #insert lonitude location into dataframe as new column
 DMIstations.insert(3,'Latitude', lat_list)                              #insert latitude location into dataframe as new column
@@ -131,18 +125,12 @@ st_ID = list(DMIstations['Station_ID'])                                 #create
 
 
 ## Insert the last longitude and latitude position for each station into dataframe:
-lon_list = []                                                           #create empty list to hold location variables
-lat_list = []
-
-for station in st_ID:
-    glob_string = 'DMI_ERA5_' + station + '_monthly.parq.gzip'          #Create a dynamic string for input to search for station specific parquet-files
-    dmi_ERA5_zip = glob.glob(glob_string)                               #Find station specific parquet-files in current directory
-    for i in dmi_ERA5_zip:
-        df = pd.read_parquet(i)                                         #Read and print parquet-file
-        #print(df)
-
-        lon_list.append(df.DMI_Lon[-1])                                 #insert final longitude position into list
-        lat_list.append(df.DMI_Lat[-1])                                 #insert final longitude position into list
+location_df = read_dataset('DMI_ERA5_monthly', st_ID, columns=['DMI_Lon', 'DMI_Lat'])      #read only the locations of all stations at once
+last_location = location_df.groupby('Station_ID').tail(1).set_index('Station_ID')     #final position of each station
+stored_st = [station for station in st_ID if station in last_location.index]         #stations in the dataset
+
+lon_list = list(last_location.loc[stored_st, 'DMI_Lon'])                #list of final longitude positions
+lat_list = list(last_location.loc[stored_st, 'DMI_Lat'])                #list of final latitude positions
 
 DMIstations.insert(2,'Longitude', lon_list)                             #insert lonitude location into dataframe as new column
 DMIstations.insert(3,'Latitude', lat_list)                              #insert latitude location into dataframe as new column
@@ -1,31 +1,33 @@
 ##### Downloading DMI-data #####
 ## Author: Bianca E. Sandvik (March 2023)
 
-## This script imports data from DMIs API for a list of stations and parameters, merges defined 5-year periods and saves it locally
-## as individual parquet files. 
+## This script imports data from DMIs API for a list of stations and parameters, merges the downloaded time windows and saves it locally
+## as individual parquet files. The time windows adapt to the density of each station´s data (see "dmi_downloader.py").
+## Downloads are recorded in a manifest ("dmi_download_manifest.json"): stations that are already stored are synced by requesting
+## only observations newer than the last stored one, and interrupted downloads continue from the last completed time window.
 ## The second part of this script inserts missing values as NaNs, creates a new dataframe holding all of the imported parameters and 
-## and saves the resulting dataframes as parquet files locally . 
+## and saves the resulting dataframes locally in a parquet dataset partitioned by station and year ("dmi_dataset.py"), together with a 
+## table of the station locations over time. 
 ## Note: The script is customised towards importing wind speed and wind direction from 1990-2022, but can be adjusted for other uses.
 
 
 
 # Import packages:
-import requests                     # For making web requests
 import pandas as pd
 import numpy as np
 from DMI_API import API_key         # Import API-key from DMI_API-script
 import fastparquet as parq          # For saving generated files to parquet-format
-import glob                         # For searching files in current directory
+import pyarrow as pa                # For combining the downloaded tables
+import pyarrow.parquet as pq
+import os
+from datetime import timedelta
+from dmi_downloader import download_stations, DownloadManifest, ResponseCache     # Concurrent download from DMIs API with adaptive time windows
+from dmi_parser import schema                                       # Columns of the downloaded tables
+from dmi_timeseries import align_to_grid                            # Alignment of observations to a regular time grid
+from dmi_dataset import write_station, read_dataset                 # Station and year partitioned parquet datasets
 
 
 
-### Create request string for DMIs API service:
-
-# Create basic string fragments:
-API = '&api-key=' + API_key
-base_url = 'https://dmigw.govcloud.dk/v2/metObs/collections/observation'
-limit = '/items?limit=300000'                      #maximum number of returned observations
-
 ## Set adjustables:
 
 # Define list of DMI stations:
@@ -41,88 +43,64 @@ DMIstations = pd.DataFrame (stationlist, columns = ['Station_ID', 'Station_name'
 
 st_ID = list(DMIstations['Station_ID'])     #create list of all station IDs
 parameter = ['wind_speed', 'wind_dir']      #define which parameters to import
-sort = '&sortorder=observed,DESC'           #sorts request with descending time
 
-start_datetime = '1990-01-01T00:00:00Z'     #Define timespann: from UTC 01.01.1990 at midnight to UTC 31.12.1999 just before midnight
+start_datetime = '1990-01-01T00:00:00Z'     #Define timespann: from UTC 01.01.1990 at midnight to UTC 31.12.2022 just before midnight
 end_datetime =   '2022-12-31T23:59:59Z'
 
-## Define 5 year periods: 
-    #Note: We can´t import more than 5 years at a time without risking to exceeding the limit of returned observations.
-startdatelist = ['1990-01-01T00:00:00Z', '1995-01-01T00:00:00Z', '2000-01-01T00:00:00Z', '2005-01-01T00:00:00Z', '2010-01-01T00:00:00Z', '2015-01-01T00:00:00Z', '2020-01-01T00:00:00Z']
-enddatelist = ['1994-12-31T23:59:59Z', '1999-12-31T23:59:59Z', '2004-12-31T23:59:59Z', '2009-12-31T23:59:59Z', '2014-12-31T23:59:59Z', '2019-12-31T23:59:59Z', '2022-12-31T23:59:59Z']
+## Define download settings:
+max_workers = 8                             #number of simultaneous requests to the API (1 gives the old serial download)
+requests_per_second = 4                     #rate-limit budget for requests to the API (None for no budget)
+first_window = timedelta(days=5*365)        #size of the first time window, later windows are scaled to fill the limit of returned observations
+sync_mode = True                            #True: only download observations newer than those already stored, False: download everything again
+manifest_file = 'dmi_download_manifest.json'    #manifest recording the downloaded data for each station and parameter
+cache_dir = 'dmi_response_cache'            #local cache of raw API responses (None for no cache)
+cache_ttl = None                            #how long responses for the current year are reused, e.g. timedelta(hours=1) (None: never)
 
 
 
 
 ###### Create request loop ######
 
-wind_speed_df_count = 0                     #Create counters for generated dataframes
-wind_dir_df_count = 0
-datelist = []                               #Create empty list to contain date periods
+manifest = DownloadManifest(manifest_file)  #Read what has already been downloaded
+cache = ResponseCache(cache_dir, cache_ttl) if cache_dir is not None else None     #closed historical windows are read from disk
+
+# Create list of all stations and parameters in the same order as the loop below consumes them:
+job_list = []
+for station in st_ID:
+    for p in range(len(parameter)):
+        job_list.append((station, parameter[p]))
+
+## Make web requests:
+    #Stations and parameters are downloaded concurrently on a shared keep-alive session. For each job the download mode ('sync' or 
+    #'full') and a list of responses (one per time window, newest first) is returned in the order of job_list.
+responses = download_stations(job_list, start_datetime, end_datetime, API_key, max_workers=max_workers, 
+                              requests_per_second=requests_per_second, window=first_window, manifest=manifest, sync=sync_mode, cache=cache)
 
-# Loop through all times for each station ID and both parameters requesting coresponding data from DMIs API service. 
-# Concatenate/merge dataframes with same variable and station and save as individual parquet-file.
+# Loop through all stations and both parameters and combine the time windows requested from DMIs API service. 
+# The windows of a station and parameter are collected and concatenated once, and each parquet-file is written exactly once.
 for station in st_ID:
-    stationID = '&stationId=' + str(station)                    #Create call for station ID
     for p in range(len(parameter)):
-        parameterId = '&parameterId=' + parameter[p]
-        print(parameterId)
-        for i in range(len(startdatelist)):
-            datelist.append(startdatelist[i] + '/' + enddatelist[i])
-            date_time = '&datetime=' + str(datelist[i])         #Returns observations between two dates. Both dates are inclusive.
-            #print(date_time)
-            request = base_url + limit + stationID + date_time + parameterId + API      #Create request string
-            print(request)
-
-
-            ## Make web request:
-            r = requests.get(str(request))
-            r.ok                                                     #check if response was sucessful
-            #print(r)
-            #print(r.headers)                                         #check content of request
-            #print(r.headers['content-type'])                         #check that it is json
-
-            resp = r.json()                                          #convert response object to dictionary
-
-            ## Convert JSON to dataframe:
-            json_norm = pd.json_normalize(resp, record_path=['features'])   #create dataframe
-            #print(json_norm)
-
-            # Format dataframe:
-            json_df = json_norm.drop(['id', 'type', 'geometry.type', 'properties.created'], axis=1)   #drop columns with listed names
-            json_df = json_df.rename(columns={"geometry.coordinates": "Longitude, Latitude", "properties.observed": "Time", "properties.parameterId": "Parameter", "properties.stationId": "Station_ID", "properties.value": parameter[p]})
-                #Rename columns
-            json_df.Time = pd.to_datetime(json_df.Time)             #Convert Time to datetime-format
-            #json_df                                                 #inspect dataframe
-
-            #Create separate dateframes for wind speed and wind direction:
-            if p == 0:                                              #If parameter='wind_speed'
-                if wind_speed_df_count < 1:                             #If first dataframe: 
-                    wind_speed_df = json_df                                 #Rename dataframe
-                    wind_speed_df_count = wind_speed_df_count + 1           #Multiply dataframe-count by one
-                else:                                                   #If not first dataframe: 
-                    wind_speed_df = pd.concat([json_df, wind_speed_df], ignore_index=True,sort=False)                    #Combine dataframes
-            else:                                                   #If parameter='wind_dir'
-                if wind_dir_df_count < 1:
-                    wind_dir_df = json_df
-                    wind_dir_df_count = wind_dir_df_count + 1
-                else:
-                    wind_dir_df = pd.concat([json_df, wind_dir_df], ignore_index=True, sort=False)                       #Combine dataframes
-            
-
-                ## Save dataframe to parquet format for each station and parameter:
-                namegenerator_speed = 'wind_speed_df_' + station + '.parq.gzip'         #create dynamic names for parquet-files
-                namegenerator_dir = 'wind_dir_df_' + station + '.parq.gzip'
-                wind_speed_df.to_parquet(namegenerator_speed, compression='gzip')       #Create parquet-file with gzip-compression
-                wind_dir_df.to_parquet(namegenerator_dir, compression='gzip')
-
-                #parq_windspeed = pd.read_parquet(namegenerator_speed)                  #read in parquet-file as pandas DataFrame
-                #parq_winddir = pd.read_parquet(namegenerator_dir)                      #read in parquet-file as pandas DataFrame
-
-        # #Change name of generated dataframes according to station ID:
-        # #for station in st_ID:
-        # vars()['wind_speed_df_' + station] = wind_speed_df
-        # vars()['wind_dir_df_'+ station] = wind_dir_df
+        print('&parameterId=' + parameter[p])
+        mode, resp_list = next(responses)                            #response as Arrow table for each time window
+            #The responses are already parsed into typed columns: Time, Station_ID, Parameter, value, Longitude and Latitude.
+
+        ## Combine all time windows (newest first) into one table:
+        param_table = pa.concat_tables(resp_list) if resp_list else schema.empty_table()     #concatenates without copying the windows
+        param_table = param_table.rename_columns([parameter[p] if name == 'value' else name for name in param_table.column_names])
+            #Rename value column to the parameter name
+
+        ## Save table to parquet format for each station and parameter:
+        namegenerator = parameter[p] + '_df_' + station + '.parq.gzip'          #create dynamic names for parquet-files
+        if len(param_table) > 0:
+            if mode == 'sync' and os.path.exists(namegenerator):               #append new observations in front of the stored ones
+                stored_table = pq.read_table(namegenerator).select(param_table.column_names).cast(param_table.schema)
+                param_table = pa.concat_tables([param_table, stored_table])
+            pq.write_table(param_table, namegenerator, compression='gzip')     #Create parquet-file with gzip-compression
+        manifest.complete(station, parameter[p], resp_list)                    #Record the newest stored observation
+        del resp_list, param_table                                             #free the windows before the next station
+
+        #parq_windspeed = pd.read_parquet('wind_speed_df_' + station + '.parq.gzip')    #read in parquet-file as pandas DataFrame
+        #parq_winddir = pd.read_parquet('wind_dir_df_' + station + '.parq.gzip')        #read in parquet-file as pandas DataFrame
 
 
 
@@ -130,85 +108,31 @@ for station in st_ID:
 
 ##### Deal with missing values ######
 
-# Create control datetime range:
-controlTime = pd.date_range(start=start_datetime,end=end_datetime,freq='10T')       #create date range over the timeperiod with 10 min frequency
-controlTime = controlTime.sort_values(ascending=False)                              #sort controlTime in descending order (matching API-order)
+## Define alignment settings:
+align_tolerance = None                      #match observations off the 10 min grid within this tolerance (e.g. '2min'), None for exact times only
+grid_end = None if sync_mode else end_datetime  #end of the time grid, None: up to the last stored observation
 
 # Create loop for inserting missing values(NaNs) and saving all the data to a new parquet file:
+nan_count_list = []                                                 #Create list to contain the number of NaNs for each station
 for station in st_ID:
-    glob_string = '*' + station + '.parq.gzip'                      #Create a dynamic string for input to search for station specific parquet-files
-    dmi_st_zip = glob.glob(glob_string)                             #Find station specific parquet-files in current directory
-    for i in dmi_st_zip:
-        if i.startswith('wind_speed'):                              #If object in parquet-file list starts with "wind_speed":
-            wind_speed_parq = pd.read_parquet(i)                        #Read and print parquet-file as wind_speed_parq
-            print(wind_speed_parq)
-        else:                                                       #If object in parquet-file list starts with "wind_dir":
-            wind_dir_parq = pd.read_parquet(i)                          #Read and print parquet-file as wind_dir_parq
-            print(wind_dir_parq)
-
-
-    ## Create arrays for new dataframe containing parameters and location: 
-    wind_speed_arr = []                                         #Create array to contain new wind array with missing values
-    jrow = 0                                                    #Initiate counter for original time series index
-    numberofnan = 0                                             #Initiate counter for NaN-values
-
-    for row in range(len(controlTime)):
-        if jrow<len(wind_speed_parq.Time) and controlTime[row] == wind_speed_parq.Time[jrow]:    #If original timeseries match control timeseries fetch wind_dir-value 
-                #Additional argument jrow<len(json_df.Time) is needed to keep loop going
-            wind_speed_arr.append(wind_speed_parq.wind_speed[jrow])
-            jrow = jrow + 1                                     #Count index for unperturbed timeindex
-        else:                                                   #If timeseries doesn´t match, insert NaN
-            wind_speed_arr.append(np.nan)
-            numberofnan = numberofnan + 1                       #Count index for inserted NaN
-    #print(wind_speed_arr)
-    print(numberofnan)
-
-
-    wind_dir_arr = []                                           #Create array to contain new wind array with missing values
-    jrow = 0                                                    #Initiate counter for original time series index
-    numberofnan = 0                                             #Initiate counter for NaN-values
-
-    for row in range(len(controlTime)):
-        if jrow<len(wind_dir_parq.Time) and controlTime[row] == wind_dir_parq.Time[jrow]:    #If original timeseries match control timeseries fetch wind_dir-value 
-                #Additional argument jrow<len(json_df.Time) is needed to keep loop going
-            wind_dir_arr.append(wind_dir_parq.wind_dir[jrow])
-            jrow = jrow + 1                                     #Count index for unperturbed timeindex
-        else:                                                   #If timeseries doesn´t match, insert NaN
-            wind_dir_arr.append(np.nan)
-            numberofnan = numberofnan + 1                       #Count index for inserted NaN
-    #print(wind_dir_arr)
-    print(numberofnan)
-
-
-    lon_lat_arr = []                                            #Create array to contain new wind array with missing values
-    jrow = 0                                                    #Initiate counter for original time series index
-    numberofnan = 0                                             #Initiate counter for NaN-values
-
-    for row in range(len(controlTime)):
-        if jrow<len(wind_dir_parq.Time) and controlTime[row] == wind_dir_parq.Time[jrow]:      #If original timeseries match control timeseries fetch lon_lat-value 
-            lon_lat_arr.append(wind_dir_parq['Longitude, Latitude'][jrow])
-            jrow = jrow + 1
-        else:                                                   #If timeseries doesn´t match, insert NaN
-            lon_lat_arr.append(np.nan)
-            numberofnan = numberofnan + 1
-    #print(lon_lat_arr)
-    print(numberofnan)
-
-
-    ## Create new dataframe containg the new arrays: 
-    new_dict = {'Longitude, Latitude': lon_lat_arr,                         #Create dictionary
-                'Time': controlTime,
-                'Wind speed': wind_speed_arr,
-                'Wind direction': wind_dir_arr}
-
-    new_df = pd.DataFrame(new_dict)                                         #Create dataframe from dictionary
+    wind_speed_parq = pd.read_parquet('wind_speed_df_' + station + '.parq.gzip', columns=['Time', 'wind_speed'])
+    wind_dir_parq = pd.read_parquet('wind_dir_df_' + station + '.parq.gzip', columns=['Time', 'wind_dir', 'Longitude', 'Latitude'])
+        #Read station specific parquet-files
+
+    ## Align both parameters and the location to a 10 min time grid, inserting NaN where observations are missing:
+    new_df, location_df, nan_count = align_to_grid(wind_speed_parq, wind_dir_parq, start_datetime, grid_end, freq='10T', tolerance=align_tolerance)
+    nan_count_list.append(nan_count.rename(station))
     #new_df
 
-    ## Create final parquet-file: 
-    namegenerator_parq_final = 'dmi_data_' + station + '.parq.gzip'         #Create dynamic naming based on station ID for final parquet-file
-    new_df.to_parquet(namegenerator_parq_final, compression='gzip')         #Create station specific parquet-file
+    ## Store in the datasets: 
+        #The wind data is stored with a UTC time index and float32 columns in "dmi_dataset/dmi_data" (partitioned by station and year),
+        #the station location as one row per position in "dmi_dataset/dmi_location".
+    write_station('dmi_data', station, new_df)
+    write_station('dmi_location', station, location_df)
 
-    print_parquet = pd.read_parquet(namegenerator_parq_final)
-    print_parquet
+# Create dataframe with the number of inserted NaNs for each station and parameter:
+nan_count_df = pd.DataFrame(nan_count_list)
+nan_count_df.index.name = 'Station_ID'
+#nan_count_df
 
-print_parquet = pd.read_parquet('dmi_data_06156.parq.gzip')
+print_parquet = read_dataset('dmi_data', ['06156'])
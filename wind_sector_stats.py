@@ -0,0 +1,48 @@
+##### Wind direction sector statistics #####
+
+## This script bins the hourly DMI and ERA5 data of each station by DMI wind direction sector and DMI wind speed class, and calculates
+## for each period (month or year), sector and speed class the number of hours, the mean DMI and ERA5 wind speed, the mean ERA5-DMI
+## wind speed difference and the mean angle alpha between the geostrophic and the 10m wind (a wind-rose cube).
+## Each cube is calculated in one vectorized pass over the hourly series ("sector_cube" in "dmi_timeseries.py") and stored in the
+## dataset "wind_rose_<period>", so the plotting scripts can read it without going through the hourly data again.
+## Uses the hourly data from "merge_dmi_data_ERA5.py" and the hourly alpha from "ageostrophic_wind.py".
+
+# Import packages:
+import pandas as pd
+import numpy as np
+from dmi_dataset import read_dataset, station_frames, write_station      #Station and year partitioned parquet datasets
+from dmi_timeseries import sector_cube                                   #Statistics by direction sector and speed class
+
+
+## Set adjustables:
+sectors = 12                                            #number of wind direction sectors (30 degrees each)
+speed_bins = (0, 2, 4, 6, 8, 10, 15)                    #lower limits of the DMI wind speed classes, unit: m/s
+periods = ['monthly', 'yearly']                         #periods of the cubes, stored in "wind_rose_<period>"
+
+# Define list of DMI stations:
+stationlist = [('06041', 'Skagen Fyr'),('06052' ,"Thyborøn"), ('06058', "Hvide Sande"), ('06079', "Anholt Havn"),
+    ('06080', "Esbjerg Lufthavn"), ('06081', "Blåvandshuk Fyr"), ('06096', "Rømø/Juvre"), ('06104', "Billund Lufthavn"),
+    ('06108', "Kolding Lufthavn"), ('06116', "Store Jyndevad"), ('06119', "Kegnæs Fyr"), ('06120', "H.C.Andersen Airport"),
+    ('06124', "Sydfyns Flyveplads"), ('06149', "Gedser"), ('06151', "Omø Fyr"), ('06156', "Holbæk Flyveplads"), ('06159', "Røsnæs Fyr"),
+    ('06168', "Nakkehoved Fyr"), ('06169', "Gniben"), ('06170', "Roskilde Lufthavn"), ('06180', "Københavns Lufthavn"),
+    ('06181', "Jægersborg"), ('06183', "Drogden Fyr"), ('06190', "Bornholms Lufthavn"), ('06193', "Hammer Odde Fyr")]
+
+DMIstations = pd.DataFrame (stationlist, columns = ['Station_ID', 'Station_name'])       #create dataframe with list station ID and Station_name
+
+st_ID = list(DMIstations['Station_ID'])                                 #create list of all station IDs
+
+
+for station in st_ID:
+    hourly_zip = station_frames('DMI_ERA5_hourly', station, columns=['DMI_wind_speed', 'DMI_wind_dir', 'ERA5_wind_speed'])
+    for hourly in hourly_zip:
+        # Hourly ERA5-DMI wind speed difference and alpha (NaN where alpha is not calculated):
+        hourly['ERA5-DMI_wind_speed'] = hourly['ERA5_wind_speed'] - hourly['DMI_wind_speed']
+        alpha = read_dataset('ageo_hourly', [station], columns=['alpha'])
+        hourly['alpha'] = alpha['alpha'].reindex(hourly.index) if len(alpha) > 0 else np.nan
+
+        ## Bin by DMI wind direction sector and wind speed class for each period:
+        for period in periods:
+            cube = sector_cube(hourly, 'DMI_wind_dir', 'DMI_wind_speed', values=['DMI_wind_speed', 'ERA5_wind_speed', 'ERA5-DMI_wind_speed'],
+                               angles=['alpha'], sectors=sectors, speed_bins=speed_bins, period=period)
+            write_station('wind_rose_' + period, station, cube)                  #Station specific partitions in "dmi_dataset/wind_rose_<period>"
+        print('Stored direction sector statistics for station', station)